@@ -1,23 +1,128 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# formats app.tasks.thumbnails.RENDITION_FORMATS can encode
+THUMBNAIL_FORMATS = ("jpeg", "webp")
+
 class Settings(BaseSettings):
     DB_HOST: str
     DB_PORT: int
     DB_USER: str
     DB_PASS: str
     DB_NAME: str
+    # per process: size + overflow connections at most, across all uvicorn workers
+    # this has to stay under the server's max_connections
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    # seconds a request waits for a free connection before failing
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # behind pgbouncer in transaction pooling mode: no prepared statement caching
+    DB_PGBOUNCER: bool = False
 
     SECRET_KEY: str
     ALGORITHM: str
     REFRESH_TOKEN_EXPIRE_DAYS: int
+    # expired refresh tokens, and revoked ones after this long, are pruned in batches
+    REFRESH_TOKEN_REVOKED_RETENTION_HOURS: int = 24
+    REFRESH_TOKEN_PRUNE_BATCH: int = 5000
+    REFRESH_TOKEN_PRUNE_INTERVAL_MINUTES: int = 60
+    # in-process revocation list: "log out everywhere" cutoffs,
+    # pulled from the DB every REVOCATION_SYNC_SECONDS
+    REVOCATION_SYNC_SECONDS: float = 5
+    REVOCATION_SYNC_OVERLAP_SECONDS: float = 60
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    # bcrypt runs in this many threads, with at most PASSWORD_HASH_QUEUE more waiting
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE: int = 32
+    # "jose" (python-jose) or "pyjwt"
+    JWT_BACKEND: str = "jose"
+    TOKEN_CACHE_SIZE: int = 10_000
+    PRINCIPAL_CACHE_SIZE: int = 10_000
+    # updates reach other workers with the revocation sync; deleted users only drop out after the TTL
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 60
+    # trust role/email claims in access tokens instead of looking the user up
+    AUTH_ROLE_CLAIMS: bool = False
 
     S3_BUCKET: str
     S3_REGION: str
     S3_ACCESS_KEY_ID: str
     S3_SECRET_ACCESS_KEY: str
+    S3_MAX_POOL_CONNECTIONS: int = 50
+    S3_CONNECT_TIMEOUT: float = 5
+    S3_READ_TIMEOUT: float = 30
+    S3_MAX_ATTEMPTS: int = 3
+    MULTIPART_PART_SIZE_MB: int = 16
+    # incomplete multipart uploads older than this are aborted
+    MULTIPART_UPLOAD_TTL_HOURS: int = 24
+    # upload and part URLs are valid this long. Deduplication only shares a blob once
+    # its key is older than this, so its uploader can't write to it any more
+    UPLOAD_URL_EXPIRES_SECONDS: int = 3600
+    PRESIGN_CACHE_SIZE: int = 10_000
+    # a cached URL is handed out until this fraction of its validity has passed
+    PRESIGN_CACHE_REUSE_FRACTION: float = 0.5
+    # deleted files are tombstoned and their objects purged by the worker
+    PURGE_BATCH_SIZE: int = 500
+    PURGE_INTERVAL_SECONDS: int = 60
+    PURGE_MAX_RETRIES: int = 5
+    RECONCILE_INTERVAL_HOURS: int = 24
+    # objects and rows younger than this are left alone by the reconciler (uploads not finalized yet)
+    RECONCILE_GRACE_HOURS: int = 24
+    RECONCILE_BLOB_BATCH: int = 1000
+    # per-user storage quota, overridable in user_usage.quota_bytes; 0 disables it
+    USER_QUOTA_BYTES: int = 10 * 1024 * 1024 * 1024
+    USAGE_RECONCILE_BATCH: int = 1000
+    USAGE_RECONCILE_INTERVAL_HOURS: int = 24
+    # search facet counts are cached per user and filter set until the user's files change
+    FACET_CACHE_SIZE: int = 10_000
+    FACET_CACHE_TTL_SECONDS: float = 300
+    # zip downloads: objects are fetched ARCHIVE_READ_AHEAD at a time, each buffering at most
+    # ARCHIVE_BUFFER_CHUNKS chunks, so an archive holds about
+    # ARCHIVE_READ_AHEAD * ARCHIVE_BUFFER_CHUNKS * ARCHIVE_CHUNK_BYTES whatever its size
+    ARCHIVE_CHUNK_BYTES: int = 1024 * 1024
+    ARCHIVE_READ_AHEAD: int = 4
+    ARCHIVE_BUFFER_CHUNKS: int = 4
 
     CELERY_BROKER_URL: str
+    # originals bigger than this are spooled to a temp file instead of RAM
+    THUMB_SPOOL_MAX_BYTES: int = 16 * 1024 * 1024
+    THUMB_HTTP_POOL_SIZE: int = 16
+    # thumbnail jobs go out THUMB_BATCH_SIZE per message, and the worker runs a message's
+    # jobs on THUMB_BATCH_WORKERS threads. A request publishes full messages itself; the
+    # rest, such as the job of a single upload, is queued in its files row and published
+    # with other requests' jobs every THUMB_DISPATCH_INTERVAL_SECONDS
+    THUMB_BATCH_SIZE: int = 32
+    THUMB_BATCH_WORKERS: int = 4
+    THUMB_DISPATCH_INTERVAL_SECONDS: float = 2
+    THUMB_DISPATCH_BATCH: int = 512
+    # jobs still pending after this long are published again
+    THUMB_PENDING_TIMEOUT_MINUTES: int = 15
+    THUMB_REQUEUE_BATCH: int = 500
+    THUMB_REQUEUE_INTERVAL_MINUTES: int = 5
+    # "<max side>:<format>" previews made from one decode of each image upload
+    THUMBNAIL_RENDITIONS: list[str] = ["64:jpeg", "256:jpeg", "1024:jpeg", "1024:webp"]
+
+    # sampling profiler: requests slower than PROFILE_SLOW_MS are dumped to PROFILE_DIR
+    # as folded stacks, keeping the PROFILE_KEEP slowest
+    PROFILE_SLOW_REQUESTS: bool = False
+    PROFILE_INTERVAL_MS: float = 5
+    PROFILE_SLOW_MS: float = 500
+    PROFILE_DIR: str = "profiles"
+    PROFILE_KEEP: int = 20
+
+    @field_validator("THUMBNAIL_RENDITIONS")
+    @classmethod
+    def _check_renditions(cls, value: list[str]) -> list[str]:
+        # a bad entry would otherwise only fail inside finalize, for every image upload
+        renditions = []
+        for item in value:
+            size, sep, fmt = item.partition(":")
+            fmt = fmt.strip().lower()
+            if not sep or not size.strip().isdigit() or int(size) <= 0 or fmt not in THUMBNAIL_FORMATS:
+                raise ValueError(f"THUMBNAIL_RENDITIONS entry {item!r} is not '<max side>:<{'|'.join(THUMBNAIL_FORMATS)}>'")
+            renditions.append(f"{int(size)}:{fmt}")
+        return renditions
 
     @property
     def database_url(self):
@@ -1,10 +1,11 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 
+from app.config import settings
 from app.database import get_async_session
-from app.models.user import User
+from app.core.principal import Principal, load_principal
+from app.core.revocation import revocations
 from app.core.security import decode_token
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -12,7 +13,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 async def get_current_user(
         token: str = Depends(oauth2_scheme),
         session: AsyncSession = Depends(get_async_session)
-) -> User:
+) -> Principal:
     payload = decode_token(token)
     if not payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
@@ -20,11 +21,18 @@ async def get_current_user(
     user_id: str = payload.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-    
-    result = await session.execute(select(User).where(User.id == int(user_id)))
-    user = result.scalar_one_or_none()
+
+    # in memory, no query: tokens from before a "log out everywhere"
+    if revocations.token_revoked(int(user_id), payload.get("iat")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+
+    if settings.AUTH_ROLE_CLAIMS and payload.get("role") and payload.get("email"):
+        return Principal(id=int(user_id), email=payload["email"], role=payload["role"])
+
+    # cached, so most requests don't touch the users table (or even check out a connection)
+    user = await load_principal(session, int(user_id))
 
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     
-    return user
\ No newline at end of file
+    return user
@@ -13,7 +13,7 @@ async def get_file_or_404(
 ) -> File:
     db_file = await session.get(File, file_id)
 
-    if not db_file or (user.role != "admin" and db_file.owner_id != user.id):
+    if not db_file or db_file.deleted_at or (user.role != "admin" and db_file.owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
     
     return db_file
\ No newline at end of file
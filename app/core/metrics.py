@@ -0,0 +1,91 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# with several uvicorn workers set PROMETHEUS_MULTIPROC_DIR so a scrape sees all of them
+
+#-----------DB pool-----------------
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the pool, including opening a new one",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT"
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use", "Connections checked out of the pool", multiprocess_mode="livesum"
+)
+DB_POOL_WAITING = Gauge(
+    "db_pool_checkouts_waiting", "Checkouts waiting for a connection", multiprocess_mode="livesum"
+)
+
+
+#-----------Requests-----------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, until the response is complete",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+STAGE_SECONDS = Histogram(
+    "app_stage_duration_seconds",
+    "Time spent in one stage (s3.head, db, presign, celery.publish, ...) per call",
+    ["stage"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+#-----------Caches-----------------
+
+# name -> TTLCache, registered where each cache is created
+_caches: dict = {}
+
+
+def register_cache(name: str, cache) -> None:
+    _caches[name] = cache
+
+
+class CacheCollector:
+    """
+    Hit/miss/eviction counters and sizes of the in-process TTL caches, read at scrape time.
+    The counters live in plain process memory, so in multiprocess mode they carry a
+    pid label and a scrape only sees the worker that answered it.
+    """
+
+    def __init__(self, per_process: bool = False):
+        self.per_process = per_process
+
+    def collect(self):
+        labels = ["cache", "pid"] if self.per_process else ["cache"]
+        families = {
+            "hits": CounterMetricFamily("app_cache_hits", "Lookups answered from the cache", labels=labels),
+            "misses": CounterMetricFamily("app_cache_misses", "Lookups that missed or found an expired entry", labels=labels),
+            "evictions": CounterMetricFamily("app_cache_evictions", "Entries dropped to stay within maxsize", labels=labels),
+            "size": GaugeMetricFamily("app_cache_entries", "Entries currently cached", labels=labels),
+        }
+        for name, cache in _caches.items():
+            values = [name, str(os.getpid())] if self.per_process else [name]
+            stats = cache.stats()
+            for stat, family in families.items():
+                family.add_metric(values, stats[stat])
+        yield from families.values()
+
+
+REGISTRY.register(CacheCollector())
+
+
+def render() -> tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, with its content type."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(CacheCollector(per_process=True))
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,41 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(uploaded_at: datetime, row_id: int) -> str:
+    raw = json.dumps([uploaded_at.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def keyset(query: Select, *, ts_col, id_col, cursor: str | None, limit: int) -> Select:
+    """
+    Newest-first page on (ts_col, id_col) that starts right after `cursor`.
+    Fetches one extra row so the caller knows if there's a next page.
+    """
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        query = query.where(tuple_(ts_col, id_col) < (ts, row_id))
+    return query.order_by(ts_col.desc(), id_col.desc()).limit(limit + 1)
+
+
+def next_cursor(rows: list, limit: int, *, ts_attr: str = "uploaded_at", id_attr: str = "id") -> str | None:
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(getattr(last, ts_attr), getattr(last, id_attr))
@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+from app.config import settings
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.models.user import User
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """What request handlers need to know about the authenticated user."""
+    id: int
+    email: str
+    role: str
+
+
+principal_cache = TTLCache(maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS)
+metrics.register_cache("principal", principal_cache)
+
+
+def invalidate_principal(user_id: int) -> None:
+    """
+    Drop a cached principal. ORM updates/deletes of User do this automatically,
+    bulk `update(User)` / `delete(User)` statements must call it themselves.
+    Other workers pick up updates through users.updated_at on their next revocation
+    sync; a deleted user stays cached there for up to PRINCIPAL_CACHE_TTL_SECONDS.
+    """
+    principal_cache.pop(user_id)
+
+
+async def load_principal(session: AsyncSession, user_id: int) -> Principal | None:
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        result = await session.execute(select(User.id, User.email, User.role).where(User.id == user_id))
+        row = result.one_or_none()
+        if row is None:
+            return None
+        principal = Principal(id=row.id, email=row.email, role=row.role)
+        principal_cache.set(user_id, principal)
+    return principal
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target: User) -> None:
+    invalidate_principal(target.id)
+    # a concurrent request may re-cache the old row before this commits, so drop it again then
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_principals", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_changed_principals(session: Session) -> None:
+    for user_id in session.info.pop("changed_principals", ()):
+        invalidate_principal(user_id)
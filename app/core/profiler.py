@@ -0,0 +1,92 @@
+import asyncio
+import heapq
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+
+def _fold(frame) -> str:
+    """One stack in the folded format flamegraph.pl and speedscope read: root first, ';' separated."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in sampling profiler for the event loop thread.
+    Every `interval` seconds a background thread takes the loop thread's stack and
+    charges it to the request whose task is running. Requests slower than
+    `slow_seconds` are written to `directory` as .folded files; only the `keep`
+    slowest are kept. Work offloaded to thread pools is not sampled.
+    """
+
+    def __init__(self, *, interval: float, slow_seconds: float, directory: str, keep: int):
+        self.interval = interval
+        self.slow_seconds = slow_seconds
+        self.directory = directory
+        self.keep = keep
+        self._samples: dict[asyncio.Task, Counter] = {}
+        # (elapsed, path) of the dumps on disk, fastest first
+        self._kept: list[tuple[float, str]] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def begin(self) -> None:
+        task = asyncio.current_task()
+        if task is not None and self._thread is not None:
+            self._samples[task] = Counter()
+
+    def end(self, name: str, elapsed: float) -> None:
+        samples = self._samples.pop(asyncio.current_task(), None)
+        if samples and elapsed >= self.slow_seconds:
+            try:
+                self._dump(name, elapsed, samples)
+            except OSError:
+                log.exception("[profiler] could not write profile")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            task = asyncio.current_task(self._loop)
+            samples = self._samples.get(task) if task is not None else None
+            if samples is None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                samples[_fold(frame)] += 1
+
+    def _dump(self, name: str, elapsed: float, samples: Counter) -> None:
+        if len(self._kept) >= self.keep and elapsed <= self._kept[0][0]:
+            return
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+        path = os.path.join(self.directory, f"{time.time_ns()}-{slug}-{int(elapsed * 1000)}ms.folded")
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in samples.most_common())
+        heapq.heappush(self._kept, (elapsed, path))
+        if len(self._kept) > self.keep:
+            _, fastest = heapq.heappop(self._kept)
+            os.remove(fastest)
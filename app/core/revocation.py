@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.core.principal import invalidate_principal
+from app.models.user import User
+
+log = logging.getLogger(__name__)
+
+
+class RevocationList:
+    """
+    Per-process view of revocations, synced from the database in small deltas.
+
+    - "Log out everywhere" cutoffs (users.tokens_valid_after) are kept exactly, so
+      get_current_user can reject older access tokens without a query.
+    - Users updated elsewhere (users.updated_at) have their cached principal dropped.
+
+    Revoked refresh tokens aren't tracked here: /auth/refresh has to revoke the row
+    it rotates anyway, and that UPDATE is the check.
+
+    Other workers see a revocation within REVOCATION_SYNC_SECONDS; the worker
+    that made it sees it immediately.
+    """
+
+    def __init__(self):
+        # user id -> unix time (float, microseconds); tokens issued before it are revoked
+        self._cutoffs: dict[int, float] = {}
+        self._synced_until: datetime | None = None
+        self._task: asyncio.Task | None = None
+
+    #-----------Checks-----------------
+
+    def token_revoked(self, user_id: int, issued_at) -> bool:
+        """
+        True when the user logged out everywhere after this token was issued.
+        Older tokens carry whole-second iats, rounded down, so they still compare older.
+        """
+        cutoff = self._cutoffs.get(user_id)
+        if cutoff is None:
+            return False
+        return not isinstance(issued_at, (int, float)) or issued_at < cutoff
+
+    #-----------Local updates-----------------
+
+    def logged_out_everywhere(self, user_id: int, cutoff: datetime) -> None:
+        self._cutoffs[user_id] = cutoff.timestamp()
+
+    #-----------Sync-----------------
+
+    async def sync(self, session_maker) -> None:
+        """Pull cutoffs and user changes newer than the last sync, dropping cutoffs no live token predates."""
+        now = datetime.now(timezone.utc)
+        oldest = now - timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        # cutoffs older than the longest token lifetime can't match a live token
+        users = select(User.id, User.tokens_valid_after).where(User.tokens_valid_after > oldest)
+        changed = None
+        if self._synced_until is not None:
+            # commits can land out of order, so every delta overlaps the last one
+            since = self._synced_until - timedelta(seconds=settings.REVOCATION_SYNC_OVERLAP_SECONDS)
+            users = users.where(User.tokens_valid_after > since)
+            changed = select(User.id).where(User.updated_at > since)
+
+        async with session_maker() as session:
+            cutoffs = (await session.execute(users)).all()
+            changed = (await session.execute(changed)).scalars().all() if changed is not None else []
+
+        self._cutoffs = {user_id: c for user_id, c in self._cutoffs.items() if c > oldest.timestamp()}
+        for user_id, cutoff in cutoffs:
+            self._cutoffs[user_id] = max(self._cutoffs.get(user_id, 0), cutoff.timestamp())
+        for user_id in changed:
+            invalidate_principal(user_id)
+        self._synced_until = now
+
+    async def _run(self, session_maker) -> None:
+        while True:
+            try:
+                await self.sync(session_maker)
+            except Exception:
+                log.exception("[revocation] sync failed, keeping the previous state")
+            await asyncio.sleep(settings.REVOCATION_SYNC_SECONDS)
+
+    def start(self, session_maker) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run(session_maker))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+revocations = RevocationList()
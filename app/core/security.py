@@ -1,13 +1,44 @@
+import asyncio
+import hashlib
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt, ExpiredSignatureError
+import jwt as pyjwt
 
 from app.config import settings
+from app.core import metrics
+from app.core.cache import TTLCache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+
+def _jose_encode(payload: dict) -> str:
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def _jose_decode(token: str) -> dict:
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+def _pyjwt_encode(payload: dict) -> str:
+    return pyjwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def _pyjwt_decode(token: str) -> dict:
+    return pyjwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+# name -> (encode, decode, errors raised by decode for a bad token)
+JWT_BACKENDS = {
+    "jose": (_jose_encode, _jose_decode, JWTError),
+    "pyjwt": (_pyjwt_encode, _pyjwt_decode, pyjwt.PyJWTError),
+}
+_encode, _decode, _decode_errors = JWT_BACKENDS[settings.JWT_BACKEND]
+
+# sha256(token) -> verified payload, kept until the token's own exp
+token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE)
+metrics.register_cache("token", token_cache)
+
 def new_jti() -> str:
     return uuid.uuid4().hex
 
@@ -17,6 +48,32 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+
+class HashingOverloaded(Exception):
+    """More password hashes are running and queued than the pool accepts."""
+
+
+# bcrypt releases the GIL, so threads give real parallelism without blocking the loop
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_inflight = 0
+
+async def _run_hash(fn, *args):
+    global _hash_inflight
+    # only touched from the event loop thread, no lock needed
+    if _hash_inflight >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE:
+        raise HashingOverloaded()
+    _hash_inflight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_inflight -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hash(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hash(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     
@@ -25,8 +82,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    # sub-second iat: a token issued right after a "log out everywhere" must compare newer
+    to_encode.update({"exp": expire, "iat": time.time()})
+    encoded_jwt = _encode(to_encode)
     
     return encoded_jwt
 
@@ -36,12 +94,27 @@ def create_refresh_token(user_id:int, jti:str) -> str:
         "sub": str(user_id),
         "jti": jti,
         "type": "refresh",
-        "exp": exp
+        "exp": exp,
+        "iat": time.time(),
     }
-    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return _encode(payload)
 
 def decode_token(token: str) -> Optional[dict]:
+    """
+    Verify and decode a token. Clients replay the same bearer token many times,
+    so verified payloads are cached by token hash until they expire.
+    """
+    cache_key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(cache_key)
+    if payload is not None:
+        return dict(payload)
+
     try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-    except JWTError:
-        return None
\ No newline at end of file
+        payload = _decode(token)
+    except _decode_errors:
+        return None
+
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        token_cache.set(cache_key, payload, ttl=exp - time.time())
+    return dict(payload)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.datastructures import MutableHeaders
+
+from app.core import metrics
+
+# stage -> [seconds, calls] for the request being handled; None outside requests
+_stages: ContextVar[dict[str, list] | None] = ContextVar("request_stages", default=None)
+
+
+def record(stage: str, seconds: float) -> None:
+    metrics.STAGE_SECONDS.labels(stage).observe(seconds)
+    stages = _stages.get()
+    if stages is not None:
+        entry = stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def span(stage: str):
+    """Time the block as `stage`; works around awaits too."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def _server_timing(stages: dict[str, list], total: float) -> str:
+    # concurrent calls (gathered HEADs, ...) add up, so dur can exceed the total
+    parts = [f'{stage};dur={seconds * 1000:.1f};desc="{calls}x"' for stage, (seconds, calls) in stages.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TimingMiddleware:
+    """
+    Collects the spans recorded while a request is handled, reports them in a
+    Server-Timing header and records the request in the Prometheus histograms.
+    Plain ASGI so streamed responses are timed until their last chunk.
+    """
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stages: dict[str, list] = {}
+        token = _stages.set(stages)
+        start = time.perf_counter()
+        status = 500
+        if self.profiler:
+            self.profiler.begin()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", _server_timing(stages, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            _stages.reset(token)
+            # the route template, so /files/{file_id} is one series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            if self.profiler:
+                self.profiler.end(f"{scope['method']} {route}", elapsed)
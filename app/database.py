@@ -1,20 +1,93 @@
 
+import time
+from uuid import uuid4
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from typing import AsyncGenerator
 
 from app.config import settings
+from app.core import metrics
+from app.core.timing import record
 
 database_url = settings.database_url
 
-engine = create_async_engine(database_url)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that reports how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        metrics.DB_POOL_WAITING.inc()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.DB_POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            metrics.DB_POOL_WAITING.dec()
+            metrics.DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+
+def _connect_args() -> dict:
+    if not settings.DB_PGBOUNCER:
+        return {}
+    # transaction pooling hands each transaction to any server connection, so
+    # prepared statements can't be cached per client connection, and their
+    # names must be unique so two clients never collide on one server connection
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+
+
+engine = create_async_engine(
+    database_url,
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args=_connect_args(),
+)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    record("db", time.perf_counter() - context._query_start)
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.DB_POOL_IN_USE.inc()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    metrics.DB_POOL_IN_USE.dec()
+
 
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+# Celery tasks run each DB job in a fresh event loop (asyncio.run),
+# and asyncpg connections can't outlive their loop, so no pooling there
+worker_engine = create_async_engine(database_url, poolclass=NullPool, connect_args=_connect_args())
+worker_session_maker = async_sessionmaker(worker_engine, expire_on_commit=False)
+
 class Base(DeclarativeBase):
     pass
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
-        yield session
\ No newline at end of file
+        yield session
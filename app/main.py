@@ -1,17 +1,62 @@
-from fastapi import FastAPI, Depends
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, Request, Response, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
-from app.database import get_async_session
+from app.config import settings
+from app.core import metrics
+from app.core.profiler import SlowRequestProfiler
+from app.core.revocation import revocations
+from app.core.timing import TimingMiddleware
+from app.core.security import HashingOverloaded
+from app.database import async_session_maker, get_async_session
 from app.routes.auth import router as auth_router
 from app.routes.files import router as file_router
 from app.tasks.celery_app import celery_app
 
-app = FastAPI()
+
+profiler = SlowRequestProfiler(
+    interval=settings.PROFILE_INTERVAL_MS / 1000,
+    slow_seconds=settings.PROFILE_SLOW_MS / 1000,
+    directory=settings.PROFILE_DIR,
+    keep=settings.PROFILE_KEEP,
+) if settings.PROFILE_SLOW_REQUESTS else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if profiler:
+        profiler.start(asyncio.get_running_loop())
+    revocations.start(async_session_maker)
+    yield
+    await revocations.stop()
+    if profiler:
+        profiler.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TimingMiddleware, profiler=profiler)
 
 app.include_router(auth_router) 
 app.include_router(file_router)
 
+@app.exception_handler(HashingOverloaded)
+async def hashing_overloaded(request: Request, exc: HashingOverloaded):
+    # shed login/register bursts quickly instead of queueing them behind bcrypt
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many authentication requests, retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 async def root():
     return {"message": "Secure File Vault API is running"}
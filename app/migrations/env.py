@@ -9,6 +9,9 @@ from app.database import Base, database_url
 from app.models.user import User
 from app.models.refresh_token import RefreshToken
 from app.models.file import File
+from app.models.blob import Blob
+from app.models.multipart_upload import MultipartUpload
+from app.models.user_usage import UserUsage
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,43 @@
+"""add refresh token pruning indexes
+
+Revision ID: 0b7e4d9a6c13
+Revises: f3a9c7d21e58
+Create Date: 2026-10-18 14:36:21.508844
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e4d9a6c13'
+down_revision: Union[str, None] = 'f3a9c7d21e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('refresh_tokens', sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=True))
+    # rows revoked before this column existed become prunable right away
+    op.execute("UPDATE refresh_tokens SET revoked_at = issued_at WHERE revoked")
+    # refresh_tokens has never been pruned and may be huge, build without locking writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'],
+            unique=False, postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_refresh_tokens_revoked_at', 'refresh_tokens', ['revoked_at'],
+            unique=False, postgresql_concurrently=True, postgresql_where=sa.text('revoked'),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_refresh_tokens_revoked_at', table_name='refresh_tokens', postgresql_concurrently=True)
+        op.drop_index('ix_refresh_tokens_expires_at', table_name='refresh_tokens', postgresql_concurrently=True)
+    op.drop_column('refresh_tokens', 'revoked_at')
@@ -0,0 +1,37 @@
+"""add tokens_valid_after to users
+
+Revision ID: 1c5a8f3e7d24
+Revises: 0b7e4d9a6c13
+Create Date: 2026-10-18 15:02:39.117406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c5a8f3e7d24'
+down_revision: Union[str, None] = '0b7e4d9a6c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('tokens_valid_after', sa.DateTime(timezone=True), nullable=True))
+    # revocation sync reads recent cutoffs only
+    op.create_index(
+        'ix_users_tokens_valid_after', 'users', ['tokens_valid_after'], unique=False,
+        postgresql_where=sa.text('tokens_valid_after IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ix_users_tokens_valid_after', table_name='users',
+        postgresql_where=sa.text('tokens_valid_after IS NOT NULL'),
+    )
+    op.drop_column('users', 'tokens_valid_after')
@@ -0,0 +1,38 @@
+"""add thumbnail queued index
+
+Revision ID: 4c7a1e9d3b52
+Revises: 9b3d5f7a2c48
+Create Date: 2026-10-18 21:14:36.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c7a1e9d3b52'
+down_revision: Union[str, None] = '9b3d5f7a2c48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # files is large, build without locking writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_files_thumbnail_queued', 'files', ['thumbnail_requested_at'],
+            unique=False, postgresql_concurrently=True,
+            postgresql_where=sa.text("thumbnail_status = 'queued'"),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_files_thumbnail_queued', table_name='files', postgresql_concurrently=True,
+            postgresql_where=sa.text("thumbnail_status = 'queued'"),
+        )
@@ -0,0 +1,41 @@
+"""add files keyset indexes
+
+Revision ID: 5b1f0c7e2a91
+Revises: 294352a40358
+Create Date: 2026-10-18 10:12:40.518211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1f0c7e2a91'
+down_revision: Union[str, None] = '294352a40358'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # files is large, build without locking writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_files_owner_uploaded_at_id', 'files',
+            ['owner_id', sa.text('uploaded_at DESC'), sa.text('id DESC')],
+            unique=False, postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_files_uploaded_at_id', 'files',
+            [sa.text('uploaded_at DESC'), sa.text('id DESC')],
+            unique=False, postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_files_uploaded_at_id', table_name='files', postgresql_concurrently=True)
+        op.drop_index('ix_files_owner_uploaded_at_id', table_name='files', postgresql_concurrently=True)
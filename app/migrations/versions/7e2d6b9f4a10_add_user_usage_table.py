@@ -0,0 +1,41 @@
+"""add user_usage table
+
+Revision ID: 7e2d6b9f4a10
+Revises: 1c5a8f3e7d24
+Create Date: 2026-10-18 15:27:44.602193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e2d6b9f4a10'
+down_revision: Union[str, None] = '1c5a8f3e7d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_usage',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('bytes', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('files', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('quota_bytes', sa.BigInteger(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # starting totals; anything finalized while this runs is fixed by reconcile_usage
+    op.execute(
+        "INSERT INTO user_usage (user_id, bytes, files) "
+        "SELECT owner_id, SUM(size), COUNT(*) FROM files WHERE deleted_at IS NULL GROUP BY owner_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_usage')
@@ -0,0 +1,47 @@
+"""add files search indexes
+
+Revision ID: 8a4c2e6f1b37
+Revises: 7e2d6b9f4a10
+Create Date: 2026-10-18 15:51:08.274913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4c2e6f1b37'
+down_revision: Union[str, None] = '7e2d6b9f4a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # needs a role allowed to create extensions (pg_trgm is trusted from PostgreSQL 13 on)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # files is large, build without locking writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_files_filename_trgm', 'files', ['filename'],
+            unique=False, postgresql_concurrently=True,
+            postgresql_using='gin', postgresql_ops={'filename': 'gin_trgm_ops'},
+        )
+        op.create_index(
+            'ix_files_owner_content_type', 'files', ['owner_id', 'content_type'],
+            unique=False, postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_files_owner_size', 'files', ['owner_id', 'size'],
+            unique=False, postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # pg_trgm is left installed, other database objects may use it
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_files_owner_size', table_name='files', postgresql_concurrently=True)
+        op.drop_index('ix_files_owner_content_type', table_name='files', postgresql_concurrently=True)
+        op.drop_index('ix_files_filename_trgm', table_name='files', postgresql_concurrently=True)
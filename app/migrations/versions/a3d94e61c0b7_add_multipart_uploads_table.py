@@ -0,0 +1,46 @@
+"""add multipart_uploads table
+
+Revision ID: a3d94e61c0b7
+Revises: 5b1f0c7e2a91
+Create Date: 2026-10-18 11:02:17.730264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d94e61c0b7'
+down_revision: Union[str, None] = '5b1f0c7e2a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('multipart_uploads',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('upload_id', sa.String(length=1024), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('storage_key', sa.String(), nullable=False),
+        sa.Column('filename', sa.String(), nullable=False),
+        sa.Column('content_type', sa.String(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('part_size', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_multipart_uploads_upload_id'), 'multipart_uploads', ['upload_id'], unique=True)
+    op.create_index(op.f('ix_multipart_uploads_owner_id'), 'multipart_uploads', ['owner_id'], unique=False)
+    op.create_index(op.f('ix_multipart_uploads_created_at'), 'multipart_uploads', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_multipart_uploads_created_at'), table_name='multipart_uploads')
+    op.drop_index(op.f('ix_multipart_uploads_owner_id'), table_name='multipart_uploads')
+    op.drop_index(op.f('ix_multipart_uploads_upload_id'), table_name='multipart_uploads')
+    op.drop_table('multipart_uploads')
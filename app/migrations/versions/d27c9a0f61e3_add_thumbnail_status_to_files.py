@@ -0,0 +1,48 @@
+"""add thumbnail status to files
+
+Revision ID: d27c9a0f61e3
+Revises: c81e5fd2b4a6
+Create Date: 2026-10-18 12:31:52.662908
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd27c9a0f61e3'
+down_revision: Union[str, None] = 'c81e5fd2b4a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('files', sa.Column('thumbnail_status', sa.String(length=16), nullable=True))
+    op.add_column('files', sa.Column('thumbnail_error', sa.String(length=500), nullable=True))
+    op.add_column('files', sa.Column('thumbnail_size', sa.BigInteger(), nullable=True))
+    op.add_column('files', sa.Column('thumbnail_requested_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('files', sa.Column('thumbnail_completed_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('files', sa.Column('thumbnail_timings', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    # thumbnails made before the worker reported back are assumed to exist
+    op.execute("UPDATE files SET thumbnail_status = 'ready' WHERE thumbnail_key IS NOT NULL")
+    op.create_index(
+        'ix_files_thumbnail_pending', 'files', ['thumbnail_requested_at'], unique=False,
+        postgresql_where=sa.text("thumbnail_status = 'pending'"),
+    )
+    op.create_index('ix_files_thumbnail_completed_at', 'files', ['thumbnail_completed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_files_thumbnail_completed_at', table_name='files')
+    op.drop_index('ix_files_thumbnail_pending', table_name='files', postgresql_where=sa.text("thumbnail_status = 'pending'"))
+    op.drop_column('files', 'thumbnail_timings')
+    op.drop_column('files', 'thumbnail_completed_at')
+    op.drop_column('files', 'thumbnail_requested_at')
+    op.drop_column('files', 'thumbnail_size')
+    op.drop_column('files', 'thumbnail_error')
+    op.drop_column('files', 'thumbnail_status')
@@ -0,0 +1,47 @@
+"""add blobs for content dedup
+
+Revision ID: e4f8b2c1d9a7
+Revises: d27c9a0f61e3
+Create Date: 2026-10-18 13:20:44.901372
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4f8b2c1d9a7'
+down_revision: Union[str, None] = 'd27c9a0f61e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('blobs',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('storage_key', sa.String(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('etag', sa.String(length=128), nullable=True),
+        sa.Column('refcount', sa.Integer(), server_default='1', nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('storage_key')
+    )
+    op.create_index('ix_blobs_size_etag', 'blobs', ['size', 'etag'], unique=True)
+    op.add_column('files', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.add_column('files', sa.Column('object_key', sa.String(), nullable=True))
+    op.create_foreign_key('fk_files_blob_id_blobs', 'files', 'blobs', ['blob_id'], ['id'], ondelete='SET NULL')
+    op.create_index(op.f('ix_files_blob_id'), 'files', ['blob_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_files_blob_id'), table_name='files')
+    op.drop_constraint('fk_files_blob_id_blobs', 'files', type_='foreignkey')
+    op.drop_column('files', 'object_key')
+    op.drop_column('files', 'blob_id')
+    op.drop_index('ix_blobs_size_etag', table_name='blobs')
+    op.drop_table('blobs')
@@ -0,0 +1,33 @@
+"""add deleted_at to files
+
+Revision ID: f3a9c7d21e58
+Revises: e4f8b2c1d9a7
+Create Date: 2026-10-18 13:48:07.215630
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9c7d21e58'
+down_revision: Union[str, None] = 'e4f8b2c1d9a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('files', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(
+        'ix_files_deleted_at', 'files', ['deleted_at'], unique=False,
+        postgresql_where=sa.text('deleted_at IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_files_deleted_at', table_name='files', postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    op.drop_column('files', 'deleted_at')
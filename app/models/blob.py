@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from sqlalchemy import String, BigInteger, Integer, DateTime, Index, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+
+class Blob(Base):
+    """
+    One physical S3 object shared by every file with the same content (size + ETag):
+    the first upload of that content, left under its uploader's key. It is only
+    shared once that key's upload URLs have expired. The object and its renditions
+    are deleted when `refcount` drops to zero.
+    """
+    __tablename__ = "blobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    storage_key: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # NULL only on older blobs whose object was overwritten in place: never matched again
+    etag: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    refcount: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+# content lookup at finalize
+Index("ix_blobs_size_etag", Blob.size, Blob.etag, unique=True)
+
+# prefix of blobs that were copied out of their upload key; upload keys always start
+# with the owner id
+BLOB_PREFIX = "blobs/"
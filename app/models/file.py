@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import ForeignKey, String, BigInteger, DateTime, func
+from sqlalchemy import ForeignKey, String, BigInteger, DateTime, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.database import Base
 
@@ -15,6 +16,51 @@ class File(Base):
     uploaded_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     storage_key: Mapped[str] = mapped_column(String, nullable=False, unique=True, index=True)
     thumbnail_key: Mapped[str] = mapped_column(String, nullable=True)
+    # rendition name ("256.jpg", "1024.webp", ...) -> storage key
+    renditions: Mapped[dict[str, str] | None] = mapped_column(JSONB, nullable=True)
+    # pending -> ready | failed, written back by the thumbnail worker; None for non-images
+    thumbnail_status: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    thumbnail_error: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    thumbnail_size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    thumbnail_requested_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    thumbnail_completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # per stage milliseconds: queue_ms, download_ms, decode_ms, encode_ms, upload_ms
+    thumbnail_timings: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     etag: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # shared content: the blob this file references and, when it differs from
+    # storage_key, the key its bytes actually live under
+    blob_id: Mapped[int | None] = mapped_column(ForeignKey("blobs.id", ondelete="SET NULL"), nullable=True, index=True)
+    object_key: Mapped[str | None] = mapped_column(String, nullable=True)
+    # tombstone: hidden from the API, objects and row purged by the worker
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
-    owner: Mapped["User"] = relationship("User", back_populates="files")
\ No newline at end of file
+    owner: Mapped["User"] = relationship("User", back_populates="files")
+
+    @property
+    def physical_key(self) -> str:
+        return self.object_key or self.storage_key
+
+
+# keyset pagination on (uploaded_at, id), newest first
+Index("ix_files_owner_uploaded_at_id", File.owner_id, File.uploaded_at.desc(), File.id.desc())
+Index("ix_files_uploaded_at_id", File.uploaded_at.desc(), File.id.desc())
+# search: filename substrings (pg_trgm), content type and size filters and facets
+Index(
+    "ix_files_filename_trgm", File.filename,
+    postgresql_using="gin", postgresql_ops={"filename": "gin_trgm_ops"},
+)
+Index("ix_files_owner_content_type", File.owner_id, File.content_type)
+Index("ix_files_owner_size", File.owner_id, File.size)
+# purge queue
+Index("ix_files_deleted_at", File.deleted_at, postgresql_where=File.deleted_at.is_not(None))
+# backlog of thumbnail jobs, oldest first
+Index(
+    "ix_files_thumbnail_pending", File.thumbnail_requested_at,
+    postgresql_where=File.thumbnail_status == "pending",
+)
+# jobs waiting for dispatch_thumbnails
+Index(
+    "ix_files_thumbnail_queued", File.thumbnail_requested_at,
+    postgresql_where=File.thumbnail_status == "queued",
+)
+Index("ix_files_thumbnail_completed_at", File.thumbnail_completed_at)
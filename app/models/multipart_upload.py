@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, String, BigInteger, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+
+class MultipartUpload(Base):
+    """An S3 multipart upload that was started but not yet completed or aborted."""
+    __tablename__ = "multipart_uploads"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    upload_id: Mapped[str] = mapped_column(String(1024), nullable=False, unique=True, index=True)
+    owner_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    storage_key: Mapped[str] = mapped_column(String, nullable=False)
+    filename: Mapped[str] = mapped_column(String, nullable=False)
+    content_type: Mapped[str] = mapped_column(String, nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    part_size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
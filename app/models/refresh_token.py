@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, Integer, String, Boolean, DateTime
+from sqlalchemy import ForeignKey, Integer, String, Boolean, DateTime, Index
 from datetime import datetime, timezone
 from app.database import Base
 
@@ -11,8 +11,14 @@ class RefreshToken(Base):
     jti: Mapped[str] = mapped_column(String(64), unique=True, index=True, nullable=False)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
     revoked: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    revoked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     issued_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
 
     user = relationship("User", back_populates="refresh_tokens")
 
+
+# pruning: expired tokens, and revoked ones once past their retention
+Index("ix_refresh_tokens_expires_at", RefreshToken.expires_at)
+Index("ix_refresh_tokens_revoked_at", RefreshToken.revoked_at, postgresql_where=RefreshToken.revoked)
+
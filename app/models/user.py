@@ -18,6 +18,15 @@ class User(Base):
         default=lambda: datetime.now(timezone.utc),
         nullable=False
     )
+    # "log out everywhere": tokens issued at or before this are rejected
+    tokens_valid_after: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # bumped by every UPDATE so other workers can drop their cached principal
+    updated_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        onupdate=lambda: datetime.now(timezone.utc),
+        nullable=True,
+        index=True,
+    )
 
     refresh_tokens = relationship("RefreshToken", cascade="all, delete-orphan", back_populates="user")
     files: Mapped[list["File"]] = relationship(back_populates="owner", cascade="all, delete-orphan")
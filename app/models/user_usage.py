@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, BigInteger, Integer, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+
+class UserUsage(Base):
+    """
+    Running total of what a user stores: live (not tombstoned) files and their sizes.
+    Kept up to date by the routes that add or remove files, corrected by reconcile_usage.
+    """
+    __tablename__ = "user_usage"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+    files: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # NULL means settings.USER_QUOTA_BYTES
+    quota_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
@@ -1,16 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, Cookie
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from app.database import get_async_session
 from app.config import settings
 from app.models.user import User
 from app.schemas.user import UserCreate, UserRead
-from app.core.security import hash_password, verify_password, create_access_token, new_jti, create_refresh_token, decode_token
+from app.core.security import hash_password_async, verify_password_async, create_access_token, new_jti, create_refresh_token, decode_token
 from app.models.refresh_token import RefreshToken
 
 from app.core.deps import get_current_user
+from app.core.principal import Principal, invalidate_principal, load_principal
+from app.core.revocation import revocations
 
 from datetime import datetime, timedelta, timezone
 
@@ -19,6 +21,13 @@ router = APIRouter(
     tags=["Auth"]
 )
 
+def _access_claims(user) -> dict:
+    claims = {"sub": str(user.id)}
+    if settings.AUTH_ROLE_CLAIMS:
+        claims.update(role=user.role, email=user.email)
+    return claims
+
+
 @router.post("/register", response_model=UserRead)
 async def register(user_data: UserCreate, session: AsyncSession = Depends(get_async_session)):
     # check if user already exists
@@ -30,7 +39,7 @@ async def register(user_data: UserCreate, session: AsyncSession = Depends(get_as
         raise HTTPException(status_code=400, detail="Email already registered")
     new_user = User(
         email=user_data.email,
-        hashed_password = hash_password(user_data.password)
+        hashed_password = await hash_password_async(user_data.password)
     )
 
     session.add(new_user)
@@ -52,10 +61,10 @@ async def login(
     result = await session.execute(select(User).where(User.email == email))
     user = result.scalar_one_or_none()
 
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await verify_password_async(password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    access_token = create_access_token(data={"sub": str(user.id)})
+    access_token = create_access_token(data=_access_claims(user))
     jti = new_jti()
     refresh_token = create_refresh_token(user.id, jti)
 
@@ -98,17 +107,28 @@ async def refresh_token(
     
     sub = payload.get("sub")
     jti = payload.get("jti")
+    if not sub or not jti:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-
-    # check if the token in db
-    result = await session.execute(select(RefreshToken).where(RefreshToken.jti == jti))
-    db_token = result.scalar_one_or_none()
-    if not db_token or db_token.revoked or db_token.expires_at < datetime.now(timezone.utc):
+    if revocations.token_revoked(int(sub), payload.get("iat")):
+        raise HTTPException(status_code=401, detail="Refresh token is not valid")
+    # revoke and check in one statement: of two concurrent refreshes with the same
+    # token only one gets the row back
+    now = datetime.now(timezone.utc)
+    revoked = await session.scalar(
+        update(RefreshToken)
+        .where(RefreshToken.jti == jti, RefreshToken.revoked.is_(False), RefreshToken.expires_at > now)
+        .values(revoked=True, revoked_at=now)
+        .returning(RefreshToken.user_id)
+    )
+    if revoked is None or str(revoked) != str(sub):
         raise HTTPException(status_code=401, detail="Refresh token is not valid")
     
-    db_token.revoked = True
+    principal = await load_principal(session, int(sub))
+    if not principal:
+        raise HTTPException(status_code=401, detail="User not found")
 
-    new_access = create_access_token({"sub": sub})
+    new_access = create_access_token(_access_claims(principal))
     new_jti_val = new_jti()
     new_refresh = create_refresh_token(int(sub), new_jti_val)
 
@@ -144,22 +164,57 @@ async def logout(
         print("Decoded payload =", payload)
 
         if payload and payload.get("type") == "refresh":
-            result = await session.execute(select(RefreshToken).where(RefreshToken.jti == payload["jti"]))
-            db_token = result.scalar_one_or_none()
-            if db_token and not db_token.revoked:
-                db_token.revoked = True
-                await session.commit()
+            await session.execute(
+                update(RefreshToken)
+                .where(RefreshToken.jti == payload["jti"], RefreshToken.revoked.is_(False))
+                .values(revoked=True, revoked_at=datetime.now(timezone.utc))
+            )
+            await session.commit()
 
     # clear cookie
     response.delete_cookie("refresh_token", path="/auth")
     return {"detail": "Logged out"}
 
 
+@router.post("/logout-all")
+async def logout_all(
+    response: Response,
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Revoke every refresh token of the user and every access token issued so far.
+    Access tokens are checked against users.tokens_valid_after in memory, so other
+    workers reject them once their revocation list has synced.
+    """
+    now = datetime.now(timezone.utc)
+    await session.execute(
+        update(User).where(User.id == current_user.id).values(tokens_valid_after=now)
+    )
+    await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == current_user.id, RefreshToken.revoked.is_(False))
+        .values(revoked=True, revoked_at=now)
+    )
+    await session.commit()
+    invalidate_principal(current_user.id)
+    revocations.logged_out_everywhere(current_user.id, now)
+
+    response.delete_cookie("refresh_token", path="/auth")
+    return {"detail": "Logged out everywhere"}
+
+
 @router.get("/me")
-async def read_me(current_user: User = Depends(get_current_user)):
+async def read_me(
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    user = await session.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
     return {
-        "id": current_user.id,
-        "email": current_user.email,
-        "role": current_user.role,
-        "created_at": current_user.created_at
+        "id": user.id,
+        "email": user.email,
+        "role": user.role,
+        "created_at": user.created_at
     }
\ No newline at end of file
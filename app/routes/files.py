@@ -1,41 +1,402 @@
+import asyncio
+import logging
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 from fastapi import APIRouter, Depends, status, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import BigInteger, Float, String, bindparam, case, column, func, literal_column, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from urllib.parse import quote
 
+from app.core import metrics
+from app.core.cache import TTLCache
 from app.core.rbac import require_role
-from app.database import get_async_session
-from app.schemas.file import FileResponse, PresignUpload, DownloadURL, FinalizeRequest
-from app.storage.s3 import S3Storage
+from app.database import get_async_session, async_session_maker
+from app.core.pagination import MAX_PAGE_SIZE, keyset, next_cursor
+from app.core.timing import span
+from app.schemas.file import (
+    FileResponse, FilePage, PresignUpload, DownloadURL, FinalizeRequest,
+    FinalizeBatchRequest, FinalizeBatchResponse, FinalizeError, PresignUploadBatch, PresignUploadBatchRequest,
+    MultipartInitiateRequest, MultipartUploadInfo, MultipartPartsRequest, MultipartParts, PresignedPart,
+    UploadedPart, MultipartCompleteRequest, StageLatency, ThumbnailStats,
+    BulkDeleteRequest, BulkDeleteResponse, UsageResponse, FileSearchPage, SearchFacets, ArchiveRequest,
+)
+from app.storage.archive import ArchiveEntry, archive_names, zip_stream
+from app.storage.s3 import AsyncS3Storage, multipart_part_size
+from app.storage.blobs import release_blobs
+from app.storage.usage import add_usage, get_usage, quota_exceeded, usage_deltas, usage_version
+from app.models.blob import Blob
 from app.models.file import File
+from app.models.multipart_upload import MultipartUpload
 from app.core.deps_file import get_file_or_404
-from app.tasks.thumbnails import resize_image
+from app.tasks.batching import submit_thumbnail_jobs
+from app.tasks.deletions import delete_objects, purge_deleted_files
+from app.tasks.celery_app import celery_app
+from app.tasks.thumbnails import THUMBNAIL_FIELDS, THUMBNAIL_STAGES, queue_thumbnail, thumbnail_job, wants_thumbnails
 from botocore.exceptions import ClientError
 from app.config import settings
 
 
+log = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/files",
     tags=["Files"]
 )
 
-s3 = S3Storage()
+s3 = AsyncS3Storage()
 
 # -------------Upload files -----------------
 
+def _new_upload(user, filename: str, content_type: str | None, size: int | None) -> dict:
+    # for namespacing
+    key = f"{user.id}/{uuid4().hex}-{filename}"
+    # a declared length is signed, so the object can't be bigger than what the quota was
+    # checked for. Without one, the quota is only enforced when the upload is finalized
+    url = s3.presigned_put(
+        key=key, content_type=content_type or "application/octet-stream", content_length=size,
+        expires_in=settings.UPLOAD_URL_EXPIRES_SECONDS,
+    )
+    return {"upload_url": url, "key": key}
+
+async def _check_quota(session: AsyncSession, user, incoming: int) -> None:
+    # one primary key lookup on user_usage, no SUM over files
+    if await quota_exceeded(session, user.id, incoming):
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Storage quota exceeded")
+
 @router.post("/presign-upload", response_model=PresignUpload)
 async def presign_upload(
     filename: str,
     content_type: str | None = None,
+    size: int | None = Query(None, ge=0),
+    session: AsyncSession = Depends(get_async_session),
     user = Depends(require_role("viewer")),
 
 ):
-    # for namespacing
-    key = f"{user.id}/{uuid4().hex}-{filename}"
-    url = s3.presigned_put(key=key, content_type=content_type or "application/octet-stream")
-    print(f"Key before finalize: {key}")
-    return {"upload_url": url, "key": key}
+    await _check_quota(session, user, size or 0)
+    upload = _new_upload(user, filename, content_type, size)
+    log.debug(f"[presign] upload key {upload['key']}")
+    return upload
+
+@router.post("/presign-upload-batch", response_model=PresignUploadBatch)
+async def presign_upload_batch(
+    payload: PresignUploadBatchRequest,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    await _check_quota(session, user, sum(f.size or 0 for f in payload.files))
+    return {"uploads": [_new_upload(user, f.filename, f.content_type, f.size) for f in payload.files]}
+
+
+def _head_error(e: ClientError) -> HTTPException | None:
+    code = getattr(e, "response", {}).get("Error", {}).get("Code")
+    if code in ("404", "NoSuchKey", "NotFound"):
+        return HTTPException(status_code=404, detail="Object not found in S3")
+    if code in ("403", "AccessDenied"):
+        return HTTPException(status_code=403, detail="Access denied to S3 object")
+    return None
+
+
+async def _shared_files(session: AsyncSession, user, keys: list[str]) -> dict[str, File]:
+    """
+    The user's files among `keys` whose upload was deleted because they share a blob:
+    HEAD finds nothing there, but the finalize already happened, so a retry gets the row.
+    """
+    if not keys:
+        return {}
+    result = await session.execute(
+        select(File).where(
+            File.storage_key.in_(keys),
+            File.owner_id == user.id,
+            File.object_key.is_not(None),
+            File.deleted_at.is_(None),
+        )
+    )
+    return {f.storage_key: f for f in result.scalars()}
+
+
+def _head_values(head: dict, payload: FinalizeRequest) -> dict:
+    return {
+        "filename": payload.filename,
+        "size": int(head.get("ContentLength", 0)),
+        "etag": (head.get("ETag") or "").strip('"'),
+        "content_type": head.get("ContentType") or payload.content_type or "application/octet-stream",
+    }
+
+
+def _file_response(db_file: File) -> FileResponse:
+    ready = getattr(db_file, "thumbnail_status", None) == "ready"
+    thumb_url = (
+        s3.presigned_get(key=db_file.thumbnail_key, expires_in=900, cache=True) 
+        if ready and getattr(db_file, "thumbnail_key", None) 
+        else None
+    )
+    renditions = {
+        name: s3.presigned_get(key=key, expires_in=900, cache=True)
+        for name, key in (getattr(db_file, "renditions", None) or {}).items()
+    } if ready else {}
+    return FileResponse(
+        id=db_file.id,
+        key=db_file.storage_key,
+        filename=db_file.filename,
+        content_type=db_file.content_type,
+        size=db_file.size,
+        etag=db_file.etag,
+        thumbnail_url=thumb_url,
+        thumbnail_status=db_file.thumbnail_status,
+        renditions=renditions or None,
+        uploaded_at=db_file.uploaded_at
+    )
+
+
+#-----------Content dedup-----------------
+
+
+async def _attach_blobs(
+        session: AsyncSession, rows: dict[str, tuple[File, bool, tuple[int | None, str | None]]]
+) -> list[str]:
+    """
+    Point each finalized row (_upsert_rows' result) at the blob holding its content
+    (same size and ETag), with one multi-row upsert. The first upload of some content
+    becomes its blob, in place under the uploader's key. Later uploads only share it
+    once the blob is older than UPLOAD_URL_EXPIRES_SECONDS, so no upload URL can still
+    change what they read; until then they keep their own object. Returns keys to
+    delete after commit: uploads that now share a blob, and a blob's objects when a
+    re-finalize dropped its last reference.
+    """
+    garbage = []
+    moved = Counter()
+    renditions = {}
+    for db_file, _, previous in rows.values():
+        if db_file.blob_id is None or previous == (db_file.size, db_file.etag):
+            continue
+        # new content under the same key: only this file moves, other sharers keep the blob
+        moved[db_file.blob_id] += 1
+        renditions[db_file.blob_id] = db_file.renditions
+        db_file.blob_id = db_file.object_key = None
+    for blob_id, key in (await release_blobs(session, moved)).items():
+        # a blob in its uploader's key now holds that upload's new content
+        if key not in rows:
+            garbage += [key, *(renditions[blob_id] or {}).values()]
+
+    by_content = defaultdict(list)
+    for db_file, _, _ in rows.values():
+        if db_file.blob_id is None and db_file.etag:
+            by_content[(db_file.size, db_file.etag)].append(db_file)
+    if not by_content:
+        return garbage
+
+    # one row per content: the same bytes twice in a batch bump the refcount twice
+    repeats = {files[0].storage_key: len(files) for files in by_content.values() if len(files) > 1}
+    stmt = pg_insert(Blob).values([
+        {"storage_key": files[0].storage_key, "size": size, "etag": etag}
+        for (size, etag), files in by_content.items()
+    ])
+    added = case(repeats, value=stmt.excluded.storage_key, else_=1) if repeats else 1
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Blob.size, Blob.etag],
+        set_={"refcount": Blob.refcount + added},
+        where=Blob.created_at < func.now() - timedelta(seconds=settings.UPLOAD_URL_EXPIRES_SECONDS),
+    ).returning(Blob.id, Blob.storage_key, Blob.size, Blob.etag, literal_column("xmax = 0").label("created"))
+
+    # blobs that are too young to share aren't returned, their files stay on their own
+    for blob in await session.execute(stmt):
+        files = by_content[(blob.size, blob.etag)]
+        if blob.created:
+            files[0].blob_id = blob.id
+            continue
+        for db_file in files:
+            db_file.blob_id = blob.id
+            db_file.object_key = blob.storage_key
+            garbage.append(db_file.storage_key)
+    return garbage
+
+
+async def _thumbnails_for(session: AsyncSession, files: list[File]) -> list[dict]:
+    """
+    Share the thumbnails of a file with the same content, else give it a resize job.
+    Siblings of all `files` are looked up with one query, and files among them that
+    share a blob share one job. Jobs that fill whole THUMB_BATCH_SIZE messages are
+    returned for the caller to publish after commit; the rest are queued in their rows
+    for dispatch_thumbnails, which sends them with other requests' jobs.
+    """
+    siblings = {}
+    shared = {f.blob_id for f in files if f.object_key}
+    if shared:
+        result = await session.execute(
+            select(File)
+            .where(
+                File.blob_id.in_(shared),
+                File.id.not_in([f.id for f in files]),
+                File.thumbnail_status.in_(("queued", "pending", "ready")),
+            )
+            .distinct(File.blob_id)
+        )
+        siblings = {f.blob_id: f for f in result.scalars()}
+
+    owners, followers = [], []
+    for db_file in files:
+        if db_file.object_key and db_file.blob_id in siblings:
+            followers.append(db_file)
+        elif wants_thumbnails(db_file):
+            owners.append(db_file)
+            if db_file.blob_id is not None:
+                siblings[db_file.blob_id] = db_file
+
+    direct = len(owners) // settings.THUMB_BATCH_SIZE * settings.THUMB_BATCH_SIZE
+    jobs = [thumbnail_job(s3, f) for f in owners[:direct]]
+    for db_file in owners[direct:]:
+        queue_thumbnail(db_file)
+    for db_file in followers:
+        # a pending sibling's job updates this row too when it finishes
+        sibling = siblings[db_file.blob_id]
+        for field in THUMBNAIL_FIELDS:
+            setattr(db_file, field, getattr(sibling, field))
+    return jobs
+
+
+async def _discard_objects(keys: list[str]) -> None:
+    """Delete objects after commit; whatever S3 refuses goes to the delete_objects retry task."""
+    if not keys:
+        return
+    try:
+        failed = [e["Key"] for e in await s3.delete_many(keys)]
+    except Exception:
+        log.exception(f"[discard] delete of {len(keys)} objects failed, retrying in the worker")
+        failed = keys
+    if not failed:
+        return
+    try:
+        with span("celery.publish"):
+            await run_in_threadpool(delete_objects.apply_async, (failed,), countdown=10)
+    except Exception:
+        # reconcile_storage still finds them
+        log.exception(f"[discard] could not queue {len(failed)} objects for retry, e.g. {failed[0]}")
+
+
+# The finalize row writes as text: SQLAlchemy can't cache a compiled postgresql INSERT,
+# and building one per finalize cost more than its round trip. With the rows passed
+# as arrays the SQL is the same for any batch size, so asyncpg's prepared statement
+# is reused too. Columns are listed by name, the table's order isn't the model's.
+_FILE_COLUMNS = ", ".join(f"files.{c.name}" for c in File.__table__.c)
+_NEW_ROWS = (
+    "unnest(:keys, :filenames, :sizes, :etags, :content_types)"
+    " AS new (storage_key, filename, size, etag, content_type)"
+)
+_ROW_PARAMS = (
+    bindparam("keys", type_=ARRAY(String)),
+    bindparam("filenames", type_=ARRAY(String)),
+    bindparam("sizes", type_=ARRAY(BigInteger)),
+    bindparam("etags", type_=ARRAY(String)),
+    bindparam("content_types", type_=ARRAY(String)),
+)
+_INSERT_FILES = text(f"""
+    INSERT INTO files (owner_id, storage_key, filename, size, etag, content_type)
+    SELECT :owner_id, new.* FROM {_NEW_ROWS}
+    ON CONFLICT (storage_key) DO NOTHING
+    RETURNING {_FILE_COLUMNS}
+""").bindparams(*_ROW_PARAMS).columns(*File.__table__.c)
+_previous_size = column("previous_size", BigInteger)
+_previous_etag = column("previous_etag", String)
+# the subquery locks the rows and keeps their values from before this update
+_UPDATE_FILES = text(f"""
+    UPDATE files
+    SET filename = new.filename, size = new.size, etag = new.etag, content_type = new.content_type
+    FROM {_NEW_ROWS}, (
+        SELECT id, size, etag FROM files
+        WHERE storage_key = ANY(:keys) AND deleted_at IS NULL
+        FOR UPDATE
+    ) AS previous
+    WHERE files.id = previous.id AND files.storage_key = new.storage_key
+    RETURNING {_FILE_COLUMNS}, previous.size AS previous_size, previous.etag AS previous_etag
+""").bindparams(*_ROW_PARAMS).columns(*File.__table__.c, _previous_size, _previous_etag)
+
+
+def _row_params(values: dict[str, dict]) -> dict[str, list]:
+    """{key: _head_values(...)} as the parallel arrays _NEW_ROWS unnests."""
+    return {
+        "keys": list(values),
+        **{f"{name}s": [v[name] for v in values.values()] for name in ("filename", "size", "etag", "content_type")},
+    }
+
+
+async def _upsert_rows(
+        session: AsyncSession, user, uploads: dict[str, tuple[FinalizeRequest, dict]]
+) -> dict[str, tuple[File, bool, tuple[int | None, str | None]]]:
+    """
+    Insert or refresh the rows for uploaded objects ({key: (payload, head)}). New keys
+    take one INSERT ... ON CONFLICT (storage_key) DO NOTHING RETURNING, so concurrent
+    finalizes of a key can't both insert. Only keys that conflicted are locked, read
+    and updated, with one more statement. Returns {key: (row, created, (size, etag)
+    before this finalize)}. Tombstoned keys are not touched and are left out.
+    Usage isn't charged here, see _charge_usage.
+    """
+    values = {key: _head_values(head, payload) for key, (payload, head) in uploads.items()}
+    result = await session.execute(
+        select(File).from_statement(_INSERT_FILES), {"owner_id": user.id, **_row_params(values)}
+    )
+    rows = {f.storage_key: (f, True, (f.size, f.etag)) for f in result.scalars()}
+
+    existing = {key: v for key, v in values.items() if key not in rows}
+    if not existing:
+        return rows
+    # a concurrent finalize's insert is committed by now: ON CONFLICT waited for it
+    result = await session.execute(
+        select(File, _previous_size, _previous_etag).from_statement(_UPDATE_FILES),
+        _row_params(existing),
+        execution_options={"populate_existing": True},
+    )
+    for db_file, previous_size, previous_etag in result:
+        rows[db_file.storage_key] = (db_file, False, (previous_size, previous_etag))
+    return rows
+
+
+async def _charge_usage(
+        session: AsyncSession, user, rows: dict[str, tuple[File, bool, tuple[int | None, str | None]]]
+) -> None:
+    """
+    Add finalized rows to the owner's usage, or roll back with 413 when that goes
+    over the quota. This locks the user's usage row until commit, so call it last:
+    every other finalize of the user waits on it.
+    """
+    # a re-finalized key only adds its size change. Usage is logical: a deduplicated
+    # file still counts in full for its owner
+    added = sum(f.size - (0 if created else previous[0]) for f, created, previous in rows.values())
+    # touch even at a zero delta: a re-finalize can change content_type, which the facet cache keys on
+    await add_usage(session, {user.id: (added, sum(created for _, created, _ in rows.values()))}, touch=True)
+    if added > 0:
+        # presign checks are per URL, several outstanding ones can add up past the quota.
+        # The usage row is locked now, so this check can't race another finalize
+        used, _, quota = await get_usage(session, user.id)
+        if quota > 0 and used > quota:
+            new_keys = [key for key, (_, created, _) in rows.items() if created]
+            await session.rollback()
+            await _discard_objects(new_keys)
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Storage quota exceeded")
+
+
+async def _upsert_file(
+        session: AsyncSession, user, payload: FinalizeRequest, head: dict
+) -> tuple[File, bool, list[dict], list[str]]:
+    """
+    Create or refresh the row for an uploaded object.
+    Returns (row, created, thumbnail jobs, keys to delete after commit).
+    """
+    rows = await _upsert_rows(session, user, {payload.key: (payload, head)})
+    if payload.key not in rows:
+        raise HTTPException(status_code=409, detail="File was deleted")
+    db_file, created, _ = rows[payload.key]
+    garbage = await _attach_blobs(session, rows)
+
+    #thumbnail job in queue
+    jobs = await _thumbnails_for(session, [db_file])
+    await _charge_usage(session, user, rows)
+    return db_file, created, jobs, garbage
+
 
 @router.post("/finalize", response_model=FileResponse, status_code=status.HTTP_201_CREATED)
 async def finalize_upload(
@@ -50,96 +411,392 @@ async def finalize_upload(
         raise HTTPException(status_code=403, detail="Key not owned by curent user")
    
     try:
-        head = s3.head(key=key)
+        head = await s3.head(key=key)
     except ClientError as e:
-        code = getattr(e, "response", {}).get("Error", {}).get("Code")
-        if code in ("404", "NoSuchKey", "NotFound"):
-            raise HTTPException(status_code=404, detail="Object not found in S3")
-        if code in ("403", "AccessDenied"):
-            raise HTTPException(status_code=403, detail="Access denied to S3 object")
+        error = _head_error(e)
+        if error and error.status_code == status.HTTP_404_NOT_FOUND:
+            shared = await _shared_files(session, user, [key])
+            if key in shared:
+                response.status_code = status.HTTP_200_OK
+                return _file_response(shared[key])
+        if error:
+            raise error
         raise
-       
-    
-    size = int(head.get("ContentLength", 0))
-    etag = (head.get("ETag") or "").strip('"')
-    ctype = head.get("ContentType") or payload.content_type or "application/octet-stream"
-
-    created = False
-
-    existing = await session.execute(select(File).where(File.storage_key == key))
-    db_file = existing.scalar_one_or_none()
-    if db_file:
-        db_file.filename = payload.filename
-        db_file.content_type = ctype
-        db_file.size = size
-        db_file.etag = etag
-    else:
-        db_file = File(
-            owner_id=user.id,
-            storage_key=key,
-            filename=payload.filename,
-            content_type=ctype,
-            size=size,
-            etag=etag,
-        )
-        session.add(db_file)
-        created = True
 
-    await session.flush()
+    db_file, created, jobs, garbage = await _upsert_file(session, user, payload, head)
+    await session.commit()
 
-    task_args = None
-    #thumbnail job in queue
-    if ctype.startswith("image/"):
-        thumb_key = f"{db_file.storage_key}@thumb_256.jpg"
-        db_file.thumbnail_key = thumb_key
-
-        get_url = s3.presigned_get(key=db_file.storage_key, expires_in=600)
-        put_url = s3.presigned_put(key=thumb_key, content_type="image/jpeg", expires_in=600)
-        task_args = (db_file.id, get_url, put_url, thumb_key)
-        
+    if jobs:
+        await submit_thumbnail_jobs(jobs)
+    await _discard_objects(garbage)
+
+    if not created:
+        response.status_code = status.HTTP_200_OK
+
+    return _file_response(db_file)
+
+
+@router.post("/finalize-batch", response_model=FinalizeBatchResponse)
+async def finalize_batch(
+    payload: FinalizeBatchRequest,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    """
+    Finalize many uploads at once: concurrent HEADs, one multi-row upsert, one
+    transaction and grouped thumbnail publishing. Keys that fail are reported in `errors`.
+    """
+    items = {item.key: item for item in payload.files}
+    errors: list[FinalizeError] = []
+
+    owned = [key for key in items if key.startswith(f"{user.id}/")]
+    errors += [FinalizeError(key=key, detail="Key not owned by curent user") for key in items if key not in owned]
+
+    heads = await asyncio.gather(*(s3.head(key=key) for key in owned), return_exceptions=True)
+    found: dict[str, dict] = {}
+    failed: dict[str, HTTPException | None] = {}
+    for key, head in zip(owned, heads):
+        if isinstance(head, ClientError):
+            failed[key] = _head_error(head)
+        elif isinstance(head, Exception):
+            raise head
+        else:
+            found[key] = head
+
+    missing = [key for key, error in failed.items() if error and error.status_code == status.HTTP_404_NOT_FOUND]
+    shared = await _shared_files(session, user, missing)
+    errors += [
+        FinalizeError(key=key, detail=error.detail if error else "S3 error")
+        for key, error in failed.items() if key not in shared
+    ]
+
+    rows = {}
+    if found:
+        rows = await _upsert_rows(session, user, {key: (items[key], head) for key, head in found.items()})
+
+    errors += [FinalizeError(key=key, detail="File was deleted") for key in found if key not in rows]
+    files = [rows[key][0] for key in found if key in rows]
+    garbage = await _attach_blobs(session, rows)
+
+    await session.flush()
+    jobs = await _thumbnails_for(session, files)
+    if rows:
+        await _charge_usage(session, user, rows)
     await session.commit()
-       
 
-    if task_args:
-        resize_image.delay(*task_args)
+    if jobs:
+        await submit_thumbnail_jobs(jobs)
+    await _discard_objects(garbage)
 
-    
+    files += shared.values()
+    return FinalizeBatchResponse(files=[_file_response(f) for f in files], errors=errors)
 
-    #biuld response
-    thumb_url = (
-        s3.presigned_get(key=db_file.thumbnail_key, expires_in=900) 
-        if getattr(db_file, "thumbnail_key", None) 
-        else None
+
+#-----------Multipart upload-----------------
+
+async def _get_multipart_upload(session: AsyncSession, upload_id: str, user) -> MultipartUpload:
+    result = await session.execute(
+        select(MultipartUpload).where(MultipartUpload.upload_id == upload_id, MultipartUpload.owner_id == user.id)
     )
+    upload = result.scalar_one_or_none()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
 
-    if not created:
-        response.status_code = status.HTTP_200_OK
 
-    return FileResponse(
-        id=db_file.id,
-        key=db_file.storage_key,
-        filename=db_file.filename,
-        content_type=db_file.content_type,
-        size=db_file.size,
-        etag=db_file.etag,
-        thumbnail_url=thumb_url,
-        uploaded_at=db_file.uploaded_at
+@router.post("/multipart/initiate", response_model=MultipartUploadInfo, status_code=status.HTTP_201_CREATED)
+async def multipart_initiate(
+    payload: MultipartInitiateRequest,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    try:
+        part_size = multipart_part_size(payload.size)
+    except ValueError:
+        raise HTTPException(status_code=413, detail="File too large")
+    await _check_quota(session, user, payload.size)
+
+    key = f"{user.id}/{uuid4().hex}-{payload.filename}"
+    content_type = payload.content_type or "application/octet-stream"
+    upload_id = await s3.create_multipart_upload(key=key, content_type=content_type)
+
+    # tracked so stale uploads can be found and aborted
+    session.add(MultipartUpload(
+        upload_id=upload_id,
+        owner_id=user.id,
+        storage_key=key,
+        filename=payload.filename,
+        content_type=content_type,
+        size=payload.size,
+        part_size=part_size,
+    ))
+    await session.commit()
+
+    return MultipartUploadInfo(
+        key=key, upload_id=upload_id, part_size=part_size, part_count=math.ceil(payload.size / part_size)
     )
 
-    
 
-    
-    
+@router.post("/multipart/{upload_id}/parts", response_model=MultipartParts)
+async def multipart_presign_parts(
+    upload_id: str,
+    payload: MultipartPartsRequest,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    upload = await _get_multipart_upload(session, upload_id, user)
+    part_count = math.ceil(upload.size / upload.part_size)
+    last_part_size = upload.size - (part_count - 1) * upload.part_size
+
+    # repeats would only sign the same URL again
+    numbers = sorted(set(payload.part_numbers)) if payload.part_numbers else range(1, part_count + 1)
+    if numbers[0] < 1 or numbers[-1] > part_count:
+        raise HTTPException(status_code=400, detail=f"Part numbers must be between 1 and {part_count}")
+
+    return MultipartParts(parts=[
+        PresignedPart(
+            part_number=n,
+            # signed lengths keep the assembled object at the declared size
+            url=s3.presigned_upload_part(
+                key=upload.storage_key, upload_id=upload_id, part_number=n,
+                content_length=last_part_size if n == part_count else upload.part_size,
+                expires_in=settings.UPLOAD_URL_EXPIRES_SECONDS,
+            ),
+        )
+        for n in numbers
+    ])
+
+
+@router.get("/multipart/{upload_id}/parts", response_model=list[UploadedPart])
+async def multipart_uploaded_parts(
+    upload_id: str,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    """Parts S3 already has, so a client can resume with the rest."""
+    upload = await _get_multipart_upload(session, upload_id, user)
+    parts = await s3.list_parts(key=upload.storage_key, upload_id=upload_id)
+    return [UploadedPart(part_number=p["PartNumber"], etag=p["ETag"].strip('"'), size=p["Size"]) for p in parts]
+
+
+@router.post("/multipart/{upload_id}/complete", response_model=FileResponse, status_code=status.HTTP_201_CREATED)
+async def multipart_complete(
+    upload_id: str,
+    payload: MultipartCompleteRequest,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    upload = await _get_multipart_upload(session, upload_id, user)
+    try:
+        await s3.complete_multipart_upload(
+            key=upload.storage_key,
+            upload_id=upload_id,
+            parts=[{"PartNumber": p.part_number, "ETag": p.etag} for p in payload.parts],
+        )
+    except ClientError as e:
+        code = getattr(e, "response", {}).get("Error", {}).get("Code")
+        raise HTTPException(status_code=400, detail=f"Could not complete upload: {code}")
+
+    # HEAD carries the final size, content type and the composite "<md5>-<parts>" ETag
+    head = await s3.head(key=upload.storage_key)
+    if int(head.get("ContentLength", 0)) > upload.size:
+        # the quota was checked against the declared size
+        await _discard_objects([upload.storage_key])
+        await session.delete(upload)
+        await session.commit()
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Upload is larger than declared")
+    finalize = FinalizeRequest(key=upload.storage_key, filename=upload.filename, content_type=upload.content_type)
+    db_file, created, jobs, garbage = await _upsert_file(session, user, finalize, head)
+    await session.delete(upload)
+    await session.commit()
+
+    if jobs:
+        await submit_thumbnail_jobs(jobs)
+    await _discard_objects(garbage)
+
+    return _file_response(db_file)
+
+
+@router.delete("/multipart/{upload_id}", status_code=204)
+async def multipart_abort(
+    upload_id: str,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    upload = await _get_multipart_upload(session, upload_id, user)
+    try:
+        await s3.abort_multipart_upload(key=upload.storage_key, upload_id=upload_id)
+    except ClientError as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") != "NoSuchUpload":
+            raise
+    await session.delete(upload)
+    await session.commit()
+
 
 #-----------List my files-----------------
 
-@router.get("/me", response_model=list[FileResponse])
+async def _file_page(session: AsyncSession, query, cursor: str | None, limit: int) -> FilePage:
+    query = keyset(query, ts_col=File.uploaded_at, id_col=File.id, cursor=cursor, limit=limit)
+    rows = (await session.execute(query)).scalars().all()
+    return FilePage(items=[_file_response(f) for f in rows[:limit]], next_cursor=next_cursor(rows, limit))
+
+
+@router.get("/me", response_model=FilePage)
 async def my_ffiles(
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
     session: AsyncSession = Depends(get_async_session),
     user = Depends(require_role("viewer")),
 ):
-    query = await session.execute(select(File).where(File.owner_id == user.id).order_by(File.uploaded_at.desc()))
-    return query.scalars().all()
+    return await _file_page(
+        session, select(File).where(File.owner_id == user.id, File.deleted_at.is_(None)), cursor, limit
+    )
+
+
+STREAM_BATCH_SIZE = 500
+
+async def _ndjson_rows(query):
+    # own session: the request-scoped one is closed before a streamed body is sent
+    async with async_session_maker() as session:
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            # rows have the File attributes _file_response reads, thumbnails are signed as in /me
+            yield b"".join(_file_response(row).model_dump_json(by_alias=True).encode() + b"\n" for row in rows)
+
+
+@router.get("/me/stream")
+async def my_files_stream(
+    user = Depends(require_role("viewer")),
+):
+    """
+    All of the user's files as NDJSON, newest first.
+    Plain columns (not ORM objects) over a server-side cursor, so memory stays flat.
+    """
+    query = (
+        select(
+            File.id, File.storage_key, File.filename, File.content_type, File.size, File.uploaded_at, File.etag,
+            File.thumbnail_status, File.thumbnail_key, File.renditions,
+        )
+        .where(File.owner_id == user.id, File.deleted_at.is_(None))
+        .order_by(File.uploaded_at.desc(), File.id.desc())
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    return StreamingResponse(_ndjson_rows(query), media_type="application/x-ndjson")
+
+
+#-----------Search------------------
+
+# (label, exclusive upper bound); the last bucket is open-ended
+SIZE_BUCKETS = [
+    ("<1MB", 1024 ** 2),
+    ("1MB-10MB", 10 * 1024 ** 2),
+    ("10MB-100MB", 100 * 1024 ** 2),
+    ("100MB-1GB", 1024 ** 3),
+    (">=1GB", None),
+]
+MAX_CONTENT_TYPE_FACETS = 20
+
+# (usage version, user id, filters) -> SearchFacets
+facet_cache = TTLCache(maxsize=settings.FACET_CACHE_SIZE, ttl=settings.FACET_CACHE_TTL_SECONDS)
+metrics.register_cache("search_facets", facet_cache)
+
+
+def _like_pattern(q: str) -> str:
+    # a plain substring match: the user's % and _ are not wildcards. "/" escapes,
+    # as in SQLAlchemy's autoescape, so the pattern doesn't depend on backslash handling
+    escaped = q.replace("/", "//").replace("%", "/%").replace("_", "/_")
+    return f"%{escaped}%"
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+async def _search_facets(session: AsyncSession, key: tuple, where: list, type_filter: list, size_filter: list) -> SearchFacets:
+    """
+    Counts by content type (without the content type filter) and by size bucket
+    (without the size range). Cached until the user's files change, so paging
+    through or repeating a search doesn't GROUP BY over the matching files again.
+    """
+    cache_key = (await usage_version(session, key[0]), *key)
+    facets = facet_cache.get(cache_key)
+    if facets is not None:
+        return facets
+
+    count = func.count().label("count")
+    types = await session.execute(
+        select(File.content_type, count)
+        .where(*where, *size_filter)
+        .group_by(File.content_type)
+        .order_by(count.desc(), File.content_type)
+        .limit(MAX_CONTENT_TYPE_FACETS)
+    )
+    bucket = case(
+        *[(File.size < upper, label) for label, upper in SIZE_BUCKETS[:-1]], else_=SIZE_BUCKETS[-1][0]
+    ).label("bucket")
+    sizes = dict((await session.execute(
+        select(bucket, count).where(*where, *type_filter).group_by(bucket)
+    )).all())
+
+    facets = SearchFacets(
+        content_types=dict(types.all()),
+        sizes={label: sizes.get(label, 0) for label, _ in SIZE_BUCKETS},
+    )
+    facet_cache.set(cache_key, facets)
+    return facets
+
+
+@router.get("/search", response_model=FileSearchPage)
+async def search_files(
+    q: str | None = Query(None, min_length=1, max_length=255),
+    content_type: list[str] | None = Query(None),
+    min_size: int | None = Query(None, ge=0),
+    max_size: int | None = Query(None, ge=0),
+    uploaded_after: datetime | None = None,
+    uploaded_before: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    """
+    The user's files filtered by filename substring, content types, size range and
+    upload time range, newest first. The first page also carries facet counts.
+    """
+    uploaded_after, uploaded_before = _as_utc(uploaded_after), _as_utc(uploaded_before)
+    where = [File.owner_id == user.id, File.deleted_at.is_(None)]
+    if q:
+        where.append(File.filename.ilike(_like_pattern(q), escape="/"))
+    if uploaded_after:
+        where.append(File.uploaded_at >= uploaded_after)
+    if uploaded_before:
+        where.append(File.uploaded_at < uploaded_before)
+    type_filter = [File.content_type.in_(content_type)] if content_type else []
+    size_filter = []
+    if min_size is not None:
+        size_filter.append(File.size >= min_size)
+    if max_size is not None:
+        size_filter.append(File.size <= max_size)
+
+    page = await _file_page(session, select(File).where(*where, *type_filter, *size_filter), cursor, limit)
+    facets = None
+    if cursor is None:
+        key = (user.id, q, tuple(sorted(content_type or ())), min_size, max_size, uploaded_after, uploaded_before)
+        facets = await _search_facets(session, key, where, type_filter, size_filter)
+    return FileSearchPage(items=page.items, next_cursor=page.next_cursor, facets=facets)
+
+
+#-----------Usage------------------
+
+@router.get("/usage", response_model=UsageResponse)
+async def my_usage(
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    used, files, quota = await get_usage(session, user.id)
+    return UsageResponse(bytes=used, files=files, quota_bytes=quota)
 
 
 #-----------Donwload url------------------
@@ -149,7 +806,7 @@ async def download_url(
     db_file: File = Depends(get_file_or_404)
 ):
     try:
-        url = s3.presigned_get(key=db_file.storage_key)
+        url = s3.presigned_get(key=db_file.physical_key, cache=True)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
@@ -157,46 +814,154 @@ async def download_url(
     
     return DownloadURL(url=url)
 
+#-----------Archive download------------------
+
+@router.post("/archive")
+async def download_archive(
+    payload: ArchiveRequest,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    """
+    Stream the files as one ZIP (stored, ZIP64), built while the objects download.
+    Entries keep the order of `file_ids`; repeated filenames get " (2)", " (3)"...
+    """
+    ids = list(dict.fromkeys(payload.file_ids))
+    query = select(File.id, File.filename, File.storage_key, File.object_key, File.uploaded_at).where(
+        File.id.in_(ids), File.deleted_at.is_(None)
+    )
+    if user.role != "admin":
+        query = query.where(File.owner_id == user.id)
+    rows = {row.id: row for row in (await session.execute(query)).all()}
+    missing = [file_id for file_id in ids if file_id not in rows]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Files not found: {missing}")
+
+    files = [rows[file_id] for file_id in ids]
+    entries = [
+        ArchiveEntry(name=name, key=f.object_key or f.storage_key, modified=f.uploaded_at)
+        for f, name in zip(files, archive_names([f.filename for f in files]))
+    ]
+    filename = quote(f"{payload.name}.zip")
+    return StreamingResponse(
+        zip_stream(s3, entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"},
+    )
+
+
 #-----------Delete-------------
 
+async def _schedule_purge(file_ids: list[int]) -> None:
+    # the periodic sweep purges the tombstones anyway if the broker is unreachable
+    try:
+        with span("celery.publish"):
+            await run_in_threadpool(purge_deleted_files.delay, file_ids)
+    except Exception:
+        pass
+
+
 @router.delete("/{file_id}", status_code=204)
 async def delete_file(
     db_file: File = Depends(get_file_or_404),
     session: AsyncSession = Depends(get_async_session),
 ):
-    keys: List[str] = [db_file.storage_key]
-    if getattr(db_file, "thumbnail_key", None):
-        keys.append(db_file.thumbnail_key)
-    else:
-        try:
-            for k in s3.list_keys(prefix=db_file.storage_key + "@"):
-                keys.append(k)
-        except Exception:
-            pass
-    try:
-        s3.delete_many(keys)
-    except Exception:
-        for k in keys:
-            try:
-                s3.delete(key=k)
-            except Exception:
-                pass
-    
-    await session.delete(db_file)
+    """Tombstone the file; its objects are removed by the purge task."""
+    # only the request that actually tombstones the row takes it out of the usage totals
+    size = await session.scalar(
+        update(File)
+        .where(File.id == db_file.id, File.deleted_at.is_(None))
+        .values(deleted_at=datetime.now(timezone.utc))
+        .returning(File.size)
+        .execution_options(synchronize_session=False)
+    )
+    if size is None:
+        return
+    await add_usage(session, {db_file.owner_id: (-size, -1)})
     await session.commit()
-    
+    await _schedule_purge([db_file.id])
+
+
+@router.post("/bulk-delete", response_model=BulkDeleteResponse)
+async def bulk_delete(
+    payload: BulkDeleteRequest,
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("viewer")),
+):
+    """
+    Tombstone many files with one UPDATE ... RETURNING. The purge task then removes
+    the rows and deletes their objects in DeleteObjects batches of 1,000, with retries.
+    """
+    ids = set(payload.file_ids)
+    stmt = update(File).where(File.id.in_(ids), File.deleted_at.is_(None))
+    if user.role != "admin":
+        stmt = stmt.where(File.owner_id == user.id)
+    rows = (await session.execute(
+        stmt.values(deleted_at=datetime.now(timezone.utc))
+        .returning(File.id, File.owner_id, File.size)
+        .execution_options(synchronize_session=False)
+    )).all()
+    await add_usage(session, usage_deltas(rows))
+    await session.commit()
+    deleted = [row.id for row in rows]
+
+    if deleted:
+        await _schedule_purge(deleted)
+
+    deleted = sorted(deleted)
+    return BulkDeleteResponse(deleted=deleted, not_found=sorted(ids.difference(deleted)))
+
 
 #-----------Admin utilities--------------------
 
-@router.get("/admin/all", response_model=list[FileResponse])
+@router.get("/admin/all", response_model=FilePage)
 async def admin_list_all(
-    limit: int = Query(50, ge=1, le=500),
-    offset: int = Query(0, ge=0),
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
     session: AsyncSession = Depends(get_async_session),
     user = Depends(require_role("admin")),
    
 ):
-    query = await session.execute(
-        select(File).order_by(File.uploaded_at.desc()).limit(limit).offset(offset)
+    return await _file_page(session, select(File).where(File.deleted_at.is_(None)), cursor, limit)
+
+
+def _broker_queue_depth() -> int | None:
+    try:
+        with celery_app.connection_for_read() as conn:
+            queue = conn.default_channel.queue_declare(queue=celery_app.conf.task_default_queue, passive=True)
+            return queue.message_count
+    except Exception:
+        return None
+
+
+@router.get("/admin/thumbnails", response_model=ThumbnailStats)
+async def admin_thumbnail_stats(
+    window_minutes: int = Query(60, ge=1, le=24 * 60),
+    session: AsyncSession = Depends(get_async_session),
+    user = Depends(require_role("admin")),
+):
+    """Thumbnail backlog and per-stage latency of jobs finished in the last `window_minutes`."""
+    counts = await session.execute(
+        select(File.thumbnail_status, func.count()).where(File.thumbnail_status.is_not(None)).group_by(File.thumbnail_status)
+    )
+    oldest = await session.scalar(
+        select(func.min(File.thumbnail_requested_at)).where(File.thumbnail_status.in_(("queued", "pending")))
+    )
+
+    since = datetime.now(timezone.utc) - timedelta(minutes=window_minutes)
+    columns = []
+    for stage in THUMBNAIL_STAGES:
+        value = File.thumbnail_timings[f"{stage}_ms"].astext.cast(Float)
+        columns += [func.avg(value), func.percentile_cont(0.95).within_group(value)]
+    row = (await session.execute(select(*columns).where(File.thumbnail_completed_at >= since))).one()
+    stages = {
+        stage: StageLatency(avg_ms=row[2 * i], p95_ms=row[2 * i + 1])
+        for i, stage in enumerate(THUMBNAIL_STAGES)
+    }
+
+    return ThumbnailStats(
+        counts=dict(counts.all()),
+        oldest_pending_seconds=(datetime.now(timezone.utc) - oldest).total_seconds() if oldest else None,
+        broker_queue_depth=await run_in_threadpool(_broker_queue_depth),
+        stages=stages,
     )
-    return query.scalars().all()
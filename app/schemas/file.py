@@ -3,12 +3,19 @@ from datetime import datetime
 from pydantic.config import ConfigDict
 
 
+MAX_BATCH_SIZE = 1000
+
+
 class FinalizeRequest(BaseModel):
     key: str
     filename: str
     content_type: str | None = None
 
 
+class FinalizeBatchRequest(BaseModel):
+    files: list[FinalizeRequest] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
 class FileResponse(BaseModel):
     id: int
     key: str = Field(serialization_alias="key", alias="storage_key")
@@ -18,12 +25,110 @@ class FileResponse(BaseModel):
     uploaded_at: datetime
     etag: str | None = None
     thumbnail_url: str | None = None
+    thumbnail_status: str | None = None
+    renditions: dict[str, str] | None = None
 
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
+class FilePage(BaseModel):
+    items: list[FileResponse]
+    next_cursor: str | None = None
+
+class SearchFacets(BaseModel):
+    # content type -> count, most common first
+    content_types: dict[str, int]
+    # size bucket label -> count, smallest bucket first
+    sizes: dict[str, int]
+
+class FileSearchPage(FilePage):
+    # first page only, they don't change with the cursor
+    facets: SearchFacets | None = None
+
+class FinalizeError(BaseModel):
+    key: str
+    detail: str
+
+class FinalizeBatchResponse(BaseModel):
+    files: list[FileResponse]
+    errors: list[FinalizeError] = []
+
+class BulkDeleteRequest(BaseModel):
+    file_ids: list[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class ArchiveRequest(BaseModel):
+    file_ids: list[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+    # download name, without the .zip
+    name: str = Field(default="files", min_length=1, max_length=200)
+
+class BulkDeleteResponse(BaseModel):
+    deleted: list[int]
+    not_found: list[int] = []
+
 class PresignUpload(BaseModel):
     upload_url: str
     key: str
 
+class PresignUploadItem(BaseModel):
+    filename: str
+    content_type: str | None = None
+    # exact size in bytes, if known: checked against the quota and signed into the upload URL
+    size: int | None = Field(default=None, ge=0)
+
+class PresignUploadBatchRequest(BaseModel):
+    files: list[PresignUploadItem] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class PresignUploadBatch(BaseModel):
+    uploads: list[PresignUpload]
+
+class UsageResponse(BaseModel):
+    bytes: int
+    files: int
+    # 0 means unlimited
+    quota_bytes: int
+
+class MultipartInitiateRequest(BaseModel):
+    filename: str
+    content_type: str | None = None
+    size: int = Field(gt=0)
+
+class MultipartUploadInfo(BaseModel):
+    key: str
+    upload_id: str
+    part_size: int
+    part_count: int
+
+class MultipartPartsRequest(BaseModel):
+    # None means every part
+    part_numbers: list[int] | None = Field(default=None, max_length=10_000)
+
+class PresignedPart(BaseModel):
+    part_number: int
+    url: str
+
+class MultipartParts(BaseModel):
+    parts: list[PresignedPart]
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+    size: int
+
+class CompletedPart(BaseModel):
+    part_number: int
+    etag: str
+
+class MultipartCompleteRequest(BaseModel):
+    parts: list[CompletedPart] = Field(min_length=1, max_length=10_000)
+
 class DownloadURL(BaseModel):
     url: str
+
+class StageLatency(BaseModel):
+    avg_ms: float | None = None
+    p95_ms: float | None = None
+
+class ThumbnailStats(BaseModel):
+    counts: dict[str, int]
+    oldest_pending_seconds: float | None = None
+    broker_queue_depth: int | None = None
+    stages: dict[str, StageLatency]
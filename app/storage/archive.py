@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import posixpath
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.config import settings
+from app.storage.s3 import AsyncS3Storage
+
+log = logging.getLogger(__name__)
+
+# earliest timestamp a zip entry can carry
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+@dataclass
+class ArchiveEntry:
+    name: str
+    key: str
+    modified: datetime
+
+
+class _Sink:
+    """
+    Write-only, unseekable file object for zipfile. Without seek zipfile writes each
+    entry's CRC and sizes in a data descriptor after its data, so nothing is rewritten.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_names(names: list[str]) -> list[str]:
+    """Flat, unique entry names: no directories (nor "..") and "name (2).ext" for repeats."""
+    seen = set()
+    unique = []
+    for name in names:
+        name = name.replace("\\", "/").rsplit("/", 1)[-1].strip() or "file"
+        if name in (".", ".."):
+            name = "file"
+        stem, ext = posixpath.splitext(name)
+        candidate, n = name, 1
+        while candidate.lower() in seen:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        seen.add(candidate.lower())
+        unique.append(candidate)
+    return unique
+
+
+async def _prefetch(s3: AsyncS3Storage, key: str, queue: asyncio.Queue) -> None:
+    # None marks the end; an exception is handed over to be raised by the writer
+    try:
+        async for chunk in s3.iter_object(key=key, chunk_size=settings.ARCHIVE_CHUNK_BYTES):
+            await queue.put(chunk)
+        await queue.put(None)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+
+
+async def zip_stream(s3: AsyncS3Storage, entries: list[ArchiveEntry]):
+    """
+    Stream a store-mode (no compression), ZIP64 archive of `entries` as it is built.
+    Up to ARCHIVE_READ_AHEAD objects are downloaded concurrently into bounded queues
+    while earlier ones are written, and every write is handed to the response
+    before the next one, so memory doesn't grow with the archive.
+    Once streaming started a failed download can't become an error status: the
+    archive is cut short and the client sees a truncated file.
+    """
+    queues: list[asyncio.Queue | None] = []
+    tasks: list[asyncio.Task | None] = []
+    written = 0
+
+    def start(index: int) -> None:
+        queue = asyncio.Queue(maxsize=settings.ARCHIVE_BUFFER_CHUNKS)
+        queues.append(queue)
+        tasks.append(asyncio.create_task(_prefetch(s3, entries[index].key, queue)))
+
+    sink = _Sink()
+    try:
+        for i in range(min(settings.ARCHIVE_READ_AHEAD, len(entries))):
+            start(i)
+
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+            for i, entry in enumerate(entries):
+                info = zipfile.ZipInfo(entry.name, date_time=max(entry.modified.timetuple()[:6], ZIP_EPOCH))
+                info.external_attr = 0o644 << 16
+                # sizes are only known once the object is read: always leave room for ZIP64
+                with archive.open(info, "w", force_zip64=True) as member:
+                    while (chunk := await queues[i].get()) is not None:
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        member.write(chunk)
+                        yield sink.drain()
+                queues[i] = tasks[i] = None
+                written += 1
+                if len(tasks) < len(entries):
+                    start(len(tasks))
+        # data descriptor of the last entry and the central directory
+        yield sink.drain()
+    except Exception:
+        log.exception(f"[archive] aborted after {written} of {len(entries)} files")
+        raise
+    finally:
+        for task in tasks:
+            if task is not None:
+                task.cancel()
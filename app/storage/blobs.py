@@ -0,0 +1,64 @@
+from collections import Counter
+
+from sqlalchemy import case, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.blob import Blob
+
+
+async def release_blobs(session: AsyncSession, counts: dict[int, int]) -> dict[int, str]:
+    """
+    Drop `counts[blob_id]` references from each blob. Returns {blob_id: key} for the
+    blobs nothing references any more; their rows are deleted.
+    """
+    if not counts:
+        return {}
+    ids = list(counts)
+    await session.execute(
+        update(Blob)
+        .where(Blob.id.in_(ids))
+        .values(refcount=Blob.refcount - case(counts, value=Blob.id))
+        .execution_options(synchronize_session=False)
+    )
+    released = await session.execute(
+        delete(Blob)
+        .where(Blob.id.in_(ids), Blob.refcount <= 0)
+        .returning(Blob.id, Blob.storage_key)
+        .execution_options(synchronize_session=False)
+    )
+    return dict(released.all())
+
+
+async def release_blob(session: AsyncSession, blob_id: int) -> str | None:
+    """Drop one reference to a blob. Returns its key once nothing references it any more."""
+    return (await release_blobs(session, {blob_id: 1})).get(blob_id)
+
+
+def owned_keys(f) -> list[str]:
+    """Objects that belong to this file alone: the upload and its thumbnails."""
+    keys = [f.storage_key]
+    if f.renditions:
+        keys += f.renditions.values()
+    elif f.thumbnail_key:
+        keys.append(f.thumbnail_key)
+    return keys
+
+
+async def unreferenced_keys(session: AsyncSession, rows) -> list[str]:
+    """
+    Keys that can be deleted once `rows` (files being removed, with storage_key,
+    renditions, thumbnail_key and blob_id) are gone: their own objects, and shared
+    objects whose last reference they held. Releases the blobs in `session`.
+    """
+    keys = []
+    shared = Counter()
+    shared_renditions = {}
+    for row in rows:
+        if row.blob_id is None:
+            keys += owned_keys(row)
+        else:
+            shared[row.blob_id] += 1
+            shared_renditions[row.blob_id] = row.renditions
+    for blob_id, key in (await release_blobs(session, shared)).items():
+        keys += [key, *(shared_renditions[blob_id] or {}).values()]
+    return keys
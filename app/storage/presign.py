@@ -0,0 +1,157 @@
+import hashlib
+import hmac
+import logging
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, quote, urlsplit
+
+log = logging.getLogger(__name__)
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+def _encode(value) -> str:
+    # same escaping botocore applies to query string pairs
+    return quote(str(value), safe="-_.~")
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+class SigV4Presigner:
+    """
+    Builds SigV4 query-string presigned URLs in-process, without botocore's
+    request building and event hooks.
+    The derived signing key only changes per day/region/service, so it is cached.
+    """
+
+    def __init__(
+            self, *,
+            access_key: str,
+            secret_key: str,
+            region: str,
+            scheme: str,
+            host: str,
+            path_prefix: str,
+            service: str = "s3",
+    ):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.service = service
+        self.scheme = scheme
+        self.host = host
+        self.path_prefix = path_prefix
+        self._signing_keys: dict[tuple[str, str, str], bytes] = {}
+
+    def signing_key(self, datestamp: str) -> bytes:
+        cache_key = (datestamp, self.region, self.service)
+        key = self._signing_keys.get(cache_key)
+        if key is None:
+            k_date = _hmac(("AWS4" + self.secret_key).encode("utf-8"), datestamp)
+            k_region = _hmac(k_date, self.region)
+            k_service = _hmac(k_region, self.service)
+            key = _hmac(k_service, "aws4_request")
+            # keys from previous days are useless, keep only the current one
+            self._signing_keys = {cache_key: key}
+        return key
+
+    def presign(
+            self,
+            method: str,
+            key: str,
+            *,
+            expires_in: int = 3600,
+            headers: dict[str, str] | None = None,
+            params: dict[str, str | int] | None = None,
+            now: datetime | None = None,
+    ) -> str:
+        now = now or datetime.now(timezone.utc)
+        timestamp = now.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = timestamp[:8]
+        scope = f"{datestamp}/{self.region}/{self.service}/aws4_request"
+
+        signed = {"host": self.host}
+        for name, value in (headers or {}).items():
+            signed[name.lower()] = " ".join(str(value).split())
+        signed_names = sorted(signed)
+        signed_headers = ";".join(signed_names)
+
+        op_pairs = [(_encode(k), _encode(v)) for k, v in (params or {}).items()]
+        auth_pairs = [
+            ("X-Amz-Algorithm", ALGORITHM),
+            ("X-Amz-Credential", _encode(f"{self.access_key}/{scope}")),
+            ("X-Amz-Date", timestamp),
+            ("X-Amz-Expires", str(expires_in)),
+            ("X-Amz-SignedHeaders", _encode(signed_headers)),
+        ]
+        path = self.path_prefix + quote(key.encode("utf-8"), safe="/~")
+
+        canonical_request = "\n".join((
+            method,
+            path,
+            "&".join(f"{k}={v}" for k, v in sorted(op_pairs + auth_pairs)),
+            "".join(f"{name}:{signed[name]}\n" for name in signed_names),
+            signed_headers,
+            UNSIGNED_PAYLOAD,
+        ))
+        string_to_sign = "\n".join((
+            ALGORITHM,
+            timestamp,
+            scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ))
+        signature = hmac.new(
+            self.signing_key(datestamp), string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+
+        query = "&".join(f"{k}={v}" for k, v in op_pairs + auth_pairs)
+        return f"{self.scheme}://{self.host}{path}?{query}&X-Amz-Signature={signature}"
+
+
+def presigner_for(client, *, bucket: str, access_key: str, secret_key: str) -> SigV4Presigner | None:
+    """
+    Build a presigner that reuses the endpoint boto3 resolved for `bucket`
+    (virtual-host vs path style, regional host), then check it produces exactly
+    the URLs boto3 does. Returns None when it doesn't, so callers keep the boto3 path.
+    """
+    try:
+        probe = urlsplit(client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": "probe"}, ExpiresIn=60
+        ))
+        if not probe.path.endswith("/probe"):
+            return None
+        presigner = SigV4Presigner(
+            access_key=access_key,
+            secret_key=secret_key,
+            region=client.meta.region_name,
+            scheme=probe.scheme,
+            host=probe.netloc,
+            path_prefix=probe.path[:-len("probe")],
+        )
+
+        # (operation, method, boto3 params, signed headers, query params)
+        checks = [
+            ("get_object", "GET", {"Key": "probe/ä b+c.txt"}, None, None),
+            ("put_object", "PUT", {"Key": "probe/x.jpg", "ContentType": "image/jpeg"},
+             {"Content-Type": "image/jpeg"}, None),
+            ("put_object", "PUT", {"Key": "probe/x.jpg", "ContentType": "image/jpeg", "ContentLength": 1234},
+             {"Content-Type": "image/jpeg", "Content-Length": "1234"}, None),
+            ("upload_part", "PUT", {"Key": "probe/x.bin", "PartNumber": 3, "UploadId": "a~b/c=", "ContentLength": 5},
+             {"Content-Length": "5"}, {"partNumber": 3, "uploadId": "a~b/c="}),
+        ]
+        for operation, method, params, headers, query in checks:
+            expected = client.generate_presigned_url(operation, Params={"Bucket": bucket, **params}, ExpiresIn=900)
+            amz_date = parse_qs(urlsplit(expected).query)["X-Amz-Date"][0]
+            now = datetime.strptime(amz_date, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            got = presigner.presign(
+                method, params["Key"], expires_in=900, headers=headers, params=query, now=now
+            )
+            if got != expected:
+                log.warning("[presign] local signer disagrees with boto3 for %s, using boto3", operation)
+                return None
+        return presigner
+    except Exception:
+        log.exception("[presign] could not set up local signer, using boto3")
+        return None
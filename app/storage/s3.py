@@ -1,41 +1,329 @@
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
 import boto3
+from botocore.config import Config
 
 from app.config import settings
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.timing import span
+from app.storage.presign import presigner_for
 from botocore.exceptions import ClientError
 
+MiB = 1024 * 1024
+# S3 multipart limits
+MIN_PART_SIZE = 5 * MiB
+MAX_PART_SIZE = 5 * 1024 * MiB
+MAX_PARTS = 10_000
+# DeleteObjects limit
+MAX_DELETE_KEYS = 1000
+
+
+def multipart_part_size(size: int) -> int:
+    """
+    Part size for an object of `size` bytes: at least MULTIPART_PART_SIZE_MB,
+    grown (in whole MiB) just enough to stay within S3's 10,000 part limit.
+    """
+    part = max(settings.MULTIPART_PART_SIZE_MB * MiB, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+    part = math.ceil(part / MiB) * MiB
+    if part > MAX_PART_SIZE:
+        raise ValueError("object too large for a multipart upload")
+    return part
+
+
+@lru_cache(maxsize=1)
+def get_s3_client():
+    """
+    One boto3 client (and so one urllib3 connection pool) per process.
+    Clients are thread-safe, so every S3Storage and the async offload pool share it.
+    """
+    return boto3.client(
+        "s3",
+        region_name = settings.S3_REGION,
+        aws_access_key_id = settings.S3_ACCESS_KEY_ID,
+        aws_secret_access_key = settings.S3_SECRET_ACCESS_KEY,
+        config = Config(
+            # botocore still presigns with SigV2 in some regions (us-east-1, ...); the local
+            # signer only speaks SigV4 and checks itself against boto3's URLs
+            signature_version="s3v4",
+            max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.S3_CONNECT_TIMEOUT,
+            read_timeout=settings.S3_READ_TIMEOUT,
+            retries={"max_attempts": settings.S3_MAX_ATTEMPTS, "mode": "standard"},
+            tcp_keepalive=True,
+        ),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_presigner():
+    return presigner_for(
+        get_s3_client(),
+        bucket=settings.S3_BUCKET,
+        access_key=settings.S3_ACCESS_KEY_ID,
+        secret_key=settings.S3_SECRET_ACCESS_KEY,
+    )
+
+
+# (key, operation, content_type, expires_in) -> url, shared by every S3Storage in the process
+url_cache = TTLCache(maxsize=settings.PRESIGN_CACHE_SIZE)
+metrics.register_cache("presigned_url", url_cache)
+
+
 class S3Storage:
     def __init__(self):
         self.bucket = settings.S3_BUCKET
-        self.client = boto3.client(
-            "s3",
-            region_name = settings.S3_REGION,
-            aws_access_key_id = settings.S3_ACCESS_KEY_ID,
-            aws_secret_access_key = settings.S3_SECRET_ACCESS_KEY,
-        )
+        self.client = get_s3_client()
+        # None when the local signer can't reproduce boto3's URLs; fall back to boto3 then
+        self.presigner = get_presigner()
+
+    def _cached_url(
+            self, operation: str, key: str, content_type: str | None, expires_in: int, sign,
+            content_length: int | None = None,
+    ) -> str:
+        """
+        Return the URL signed earlier for the same object and operation while enough
+        of its validity remains, so clients and CDNs see a stable URL.
+        """
+        cache_key = (key, operation, content_type, content_length, expires_in)
+        url = url_cache.get(cache_key)
+        if url is None:
+            url = sign()
+            url_cache.set(cache_key, url, ttl=expires_in * settings.PRESIGN_CACHE_REUSE_FRACTION)
+        return url
+
+    def presigned_put(
+            self, *, key: str, expires_in: int = 3600, content_type: str | None, content_length: int | None = None,
+            cache: bool = False,
+    ):
+        """With `content_length` the length is signed: S3 rejects a PUT of any other size."""
+        if cache:
+            return self._cached_url(
+                "put_object", key, content_type, expires_in,
+                lambda: self.presigned_put(
+                    key=key, expires_in=expires_in, content_type=content_type, content_length=content_length
+                ),
+                content_length=content_length,
+            )
+
+        if self.presigner:
+            headers = {}
+            if content_type:
+                headers["Content-Type"] = content_type
+            if content_length is not None:
+                headers["Content-Length"] = str(content_length)
+            return self.presigner.presign("PUT", key, expires_in=expires_in, headers=headers or None)
 
-    def presigned_put(self, *, key: str, expires_in: int = 3600, content_type: str | None):
         params = {"Bucket": self.bucket, "Key": key}
         if content_type:
             params["ContentType"] = content_type
+        if content_length is not None:
+            params["ContentLength"] = content_length
         return self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires_in)
-    
 
-    def presigned_get(self, *, key: str, expires_in: int = 3600) -> str:
+
+    def presigned_get(self, *, key: str, expires_in: int = 3600, cache: bool = False) -> str:
+        if cache:
+            return self._cached_url(
+                "get_object", key, None, expires_in,
+                lambda: self.presigned_get(key=key, expires_in=expires_in),
+            )
+
+        if self.presigner:
+            return self.presigner.presign("GET", key, expires_in=expires_in)
+
         params = {"Bucket": self.bucket, "Key": key}
 
         return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
-        
+
 
     # get metadata
     def head(self, *, key: str) -> dict:
-      
+
         return self.client.head_object(Bucket=self.bucket, Key=key)
 
-    
+
+    def get_body(self, *, key: str):
+        """The object's StreamingBody; nothing is read until the caller does."""
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+
     def delete(self, *, key: str) -> None:
         self.client.delete_object(Bucket=self.bucket, Key=key)
 
-    
+
+    def delete_many(self, keys: list[str]) -> list[dict]:
+        """
+        Batched DeleteObjects, MAX_DELETE_KEYS per call. Returns the failures as
+        {"Key", "Code", "Message"} dicts; keys that don't exist count as deleted.
+        """
+        errors = []
+        for i in range(0, len(keys), MAX_DELETE_KEYS):
+            chunk = keys[i:i + MAX_DELETE_KEYS]
+            try:
+                resp = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": k} for k in chunk], "Quiet": True},
+                )
+            except ClientError as e:
+                error = e.response.get("Error", {})
+                errors += [{"Key": k, "Code": error.get("Code"), "Message": error.get("Message")} for k in chunk]
+                continue
+            errors += resp.get("Errors", [])
+        return errors
+
+
+    def list_objects(self, prefix: str) -> list[dict]:
+        """Every object under `prefix`, as ListObjectsV2 "Contents" entries (Key, Size, LastModified, ...)."""
+        paginator = self.client.get_paginator("list_objects_v2")
+        objects = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            objects += page.get("Contents", [])
+        return objects
+
+
+    def list_keys(self, prefix: str) -> list[str]:
+        return [obj["Key"] for obj in self.list_objects(prefix)]
+
+
+    def list_common_prefixes(self, prefix: str = "", delimiter: str = "/") -> list[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        prefixes = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter=delimiter):
+            prefixes += [p["Prefix"] for p in page.get("CommonPrefixes", [])]
+        return prefixes
+
+
     def list_prefix(self, prefix: str):
-        resp = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
-        return [obj["Key"] for obj in resp.get("Contents", [])]
\ No newline at end of file
+        return self.list_keys(prefix)
+
+
+    # multipart uploads
+    def create_multipart_upload(self, *, key: str, content_type: str | None) -> str:
+        params = {"Bucket": self.bucket, "Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        return self.client.create_multipart_upload(**params)["UploadId"]
+
+    def presigned_upload_part(
+            self, *, key: str, upload_id: str, part_number: int, content_length: int, expires_in: int = 3600
+    ) -> str:
+        if self.presigner:
+            return self.presigner.presign(
+                "PUT", key, expires_in=expires_in, headers={"Content-Length": str(content_length)},
+                params={"partNumber": part_number, "uploadId": upload_id},
+            )
+        params = {
+            "Bucket": self.bucket, "Key": key, "PartNumber": part_number, "UploadId": upload_id,
+            "ContentLength": content_length,
+        }
+        return self.client.generate_presigned_url("upload_part", Params=params, ExpiresIn=expires_in)
+
+    def list_parts(self, *, key: str, upload_id: str) -> list[dict]:
+        paginator = self.client.get_paginator("list_parts")
+        parts = []
+        for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=upload_id):
+            parts += page.get("Parts", [])
+        return parts
+
+    def complete_multipart_upload(self, *, key: str, upload_id: str, parts: list[dict]) -> dict:
+        """`parts` are {"PartNumber", "ETag"} dicts; the response carries the composite ETag."""
+        return self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
+        )
+
+    def abort_multipart_upload(self, *, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+    def list_multipart_uploads(self, prefix: str = "") -> list[dict]:
+        paginator = self.client.get_paginator("list_multipart_uploads")
+        uploads = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            uploads += page.get("Uploads", [])
+        return uploads
+
+
+# pool size matches the connection pool so a worker thread never waits for a socket
+_executor = ThreadPoolExecutor(max_workers=settings.S3_MAX_POOL_CONNECTIONS, thread_name_prefix="s3")
+
+
+class AsyncS3Storage:
+    """
+    S3Storage for async handlers.
+    Calls that hit the network are awaited in a bounded thread pool so a slow
+    round trip never blocks the event loop. Presigning is local CPU work and stays sync.
+    """
+    def __init__(self, storage: S3Storage | None = None):
+        self.sync = storage or S3Storage()
+        self.bucket = self.sync.bucket
+
+    async def _run(self, fn, /, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # includes waiting for a pool thread, which is part of what the request pays
+        with span(f"s3.{fn.__name__}"):
+            return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+    def presigned_put(
+            self, *, key: str, expires_in: int = 3600, content_type: str | None, content_length: int | None = None,
+            cache: bool = False,
+    ):
+        with span("presign"):
+            return self.sync.presigned_put(
+                key=key, expires_in=expires_in, content_type=content_type, content_length=content_length, cache=cache
+            )
+
+    def presigned_get(self, *, key: str, expires_in: int = 3600, cache: bool = False) -> str:
+        with span("presign"):
+            return self.sync.presigned_get(key=key, expires_in=expires_in, cache=cache)
+
+    async def head(self, *, key: str) -> dict:
+        return await self._run(self.sync.head, key=key)
+
+    async def delete(self, *, key: str) -> None:
+        await self._run(self.sync.delete, key=key)
+
+    async def iter_object(self, *, key: str, chunk_size: int):
+        """An object's bytes, `chunk_size` at a time, one blocking read per chunk in the pool."""
+        body = await self._run(self.sync.get_body, key=key)
+        try:
+            while chunk := await self._run(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete_many(self, keys: list[str]) -> list[dict]:
+        # one DeleteObjects call per thread, so large deletes go out in parallel
+        chunks = [keys[i:i + MAX_DELETE_KEYS] for i in range(0, len(keys), MAX_DELETE_KEYS)]
+        results = await asyncio.gather(*(self._run(self.sync.delete_many, chunk) for chunk in chunks))
+        return [error for errors in results for error in errors]
+
+    async def list_keys(self, prefix: str) -> list[str]:
+        return await self._run(self.sync.list_keys, prefix)
+
+    async def list_prefix(self, prefix: str):
+        return await self._run(self.sync.list_prefix, prefix)
+
+    async def create_multipart_upload(self, *, key: str, content_type: str | None) -> str:
+        return await self._run(self.sync.create_multipart_upload, key=key, content_type=content_type)
+
+    def presigned_upload_part(
+            self, *, key: str, upload_id: str, part_number: int, content_length: int, expires_in: int = 3600
+    ) -> str:
+        with span("presign"):
+            return self.sync.presigned_upload_part(
+                key=key, upload_id=upload_id, part_number=part_number, content_length=content_length,
+                expires_in=expires_in,
+            )
+
+    async def list_parts(self, *, key: str, upload_id: str) -> list[dict]:
+        return await self._run(self.sync.list_parts, key=key, upload_id=upload_id)
+
+    async def complete_multipart_upload(self, *, key: str, upload_id: str, parts: list[dict]) -> dict:
+        return await self._run(self.sync.complete_multipart_upload, key=key, upload_id=upload_id, parts=parts)
+
+    async def abort_multipart_upload(self, *, key: str, upload_id: str) -> None:
+        await self._run(self.sync.abort_multipart_upload, key=key, upload_id=upload_id)
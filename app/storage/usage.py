@@ -0,0 +1,59 @@
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.user_usage import UserUsage
+
+
+async def add_usage(session: AsyncSession, deltas: dict[int, tuple[int, int]], touch: bool = False) -> None:
+    """
+    Apply {user_id: (bytes, files)} deltas to user_usage in the caller's transaction.
+    Rows are locked in user_id order, so concurrent callers can't deadlock on them.
+    Zero deltas are skipped unless `touch`, which still bumps updated_at for files
+    that changed without changing the totals.
+    """
+    values = [
+        {"user_id": user_id, "bytes": size, "files": count}
+        for user_id, (size, count) in sorted(deltas.items())
+        if size or count or touch
+    ]
+    if not values:
+        return
+    stmt = pg_insert(UserUsage).values(values)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[UserUsage.user_id],
+        set_={
+            "bytes": UserUsage.bytes + stmt.excluded.bytes,
+            "files": UserUsage.files + stmt.excluded.files,
+            "updated_at": func.now(),
+        },
+    ))
+
+
+def usage_deltas(rows) -> dict[int, tuple[int, int]]:
+    """Deltas that take `rows` (removed files, with owner_id and size) out of the totals."""
+    deltas: dict[int, tuple[int, int]] = {}
+    for row in rows:
+        size, count = deltas.get(row.owner_id, (0, 0))
+        deltas[row.owner_id] = (size - row.size, count - 1)
+    return deltas
+
+
+async def get_usage(session: AsyncSession, user_id: int) -> tuple[int, int, int]:
+    """(bytes, files, quota) for a user by primary key; quota 0 means unlimited."""
+    row = (await session.execute(
+        select(UserUsage.bytes, UserUsage.files, UserUsage.quota_bytes).where(UserUsage.user_id == user_id)
+    )).one_or_none()
+    used, files, quota = row if row else (0, 0, None)
+    return used, files, settings.USER_QUOTA_BYTES if quota is None else quota
+
+
+async def quota_exceeded(session: AsyncSession, user_id: int, incoming: int) -> bool:
+    used, _, quota = await get_usage(session, user_id)
+    return quota > 0 and used + incoming > quota
+
+
+async def usage_version(session: AsyncSession, user_id: int):
+    """user_usage.updated_at: moves whenever the user's files are added, changed or removed, a cheap cache key."""
+    return await session.scalar(select(UserUsage.updated_at).where(UserUsage.user_id == user_id))
@@ -0,0 +1,24 @@
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.timing import span
+from app.tasks.thumbnails import publish_jobs
+
+log = logging.getLogger(__name__)
+
+
+async def submit_thumbnail_jobs(jobs: list[dict]) -> None:
+    """
+    Publish the thumbnail jobs of one request right away, grouped into
+    resize_image_batch messages. Jobs too few to fill a message wait in their files rows
+    for dispatch_thumbnails instead (see _thumbnails_for), never in API memory. If
+    publishing fails the rows stay pending and requeue_stale_thumbnails publishes them again.
+    """
+    if not jobs:
+        return
+    try:
+        with span("celery.publish"):
+            await run_in_threadpool(publish_jobs, jobs)
+    except Exception:
+        log.exception(f"[thumb] failed to publish {len(jobs)} jobs, left for the requeue sweep")
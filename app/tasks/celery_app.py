@@ -7,6 +7,10 @@ celery_app = Celery(
     broker=settings.CELERY_BROKER_URL,
     include=[
         "app.tasks.thumbnails",
+        "app.tasks.uploads",
+        "app.tasks.deletions",
+        "app.tasks.tokens",
+        "app.tasks.usage",
         ]
 )
 celery_app.autodiscover_tasks(["app.tasks"])
@@ -19,4 +23,34 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="Asia/Almaty",
     enable_utc=True,
+    beat_schedule={
+        "abort-stale-multipart-uploads": {
+            "task": "app.tasks.uploads.abort_stale_multipart_uploads",
+            "schedule": 60 * 60,
+        },
+        "purge-deleted-files": {
+            "task": "app.tasks.deletions.purge_deleted_files",
+            "schedule": settings.PURGE_INTERVAL_SECONDS,
+        },
+        "reconcile-storage": {
+            "task": "app.tasks.deletions.reconcile_storage",
+            "schedule": settings.RECONCILE_INTERVAL_HOURS * 60 * 60,
+        },
+        "prune-refresh-tokens": {
+            "task": "app.tasks.tokens.prune_refresh_tokens",
+            "schedule": settings.REFRESH_TOKEN_PRUNE_INTERVAL_MINUTES * 60,
+        },
+        "dispatch-thumbnails": {
+            "task": "app.tasks.thumbnails.dispatch_thumbnails",
+            "schedule": settings.THUMB_DISPATCH_INTERVAL_SECONDS,
+        },
+        "requeue-stale-thumbnails": {
+            "task": "app.tasks.thumbnails.requeue_stale_thumbnails",
+            "schedule": settings.THUMB_REQUEUE_INTERVAL_MINUTES * 60,
+        },
+        "reconcile-usage": {
+            "task": "app.tasks.usage.reconcile_usage",
+            "schedule": settings.USAGE_RECONCILE_INTERVAL_HOURS * 60 * 60,
+        },
+    },
 )
\ No newline at end of file
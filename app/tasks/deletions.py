@@ -0,0 +1,243 @@
+from celery import shared_task
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, func, or_, select, update
+import asyncio
+import logging
+
+from app.config import settings
+from app.database import worker_session_maker
+from app.models.blob import BLOB_PREFIX, Blob
+from app.models.file import File
+from app.models.user import User
+from app.storage.blobs import unreferenced_keys
+from app.storage.usage import add_usage, usage_deltas
+from app.storage.s3 import S3Storage
+
+log = logging.getLogger(__name__)
+
+
+#-----------Purge tombstoned files-----------------
+
+async def _purge_batch(file_ids: list[int] | None) -> tuple[int, list[str]]:
+    """
+    Remove up to PURGE_BATCH_SIZE tombstoned rows and release their blobs, in one
+    transaction. Returns (rows removed, keys to delete from S3).
+    Rows another worker is purging are skipped rather than waited for.
+    """
+    async with worker_session_maker() as session:
+        query = select(File.id, File.storage_key, File.renditions, File.thumbnail_key, File.blob_id).where(
+            File.deleted_at.is_not(None)
+        )
+        if file_ids is not None:
+            query = query.where(File.id.in_(file_ids))
+        query = query.order_by(File.deleted_at).limit(settings.PURGE_BATCH_SIZE).with_for_update(skip_locked=True)
+        rows = (await session.execute(query)).all()
+        if not rows:
+            return 0, []
+
+        keys = await unreferenced_keys(session, rows)
+        await session.execute(delete(File).where(File.id.in_([row.id for row in rows])))
+        await session.commit()
+        return len(rows), keys
+
+
+def _delete_keys(storage: S3Storage, keys: list[str]) -> None:
+    failed = [e["Key"] for e in storage.delete_many(keys)]
+    if failed:
+        delete_objects.apply_async((failed,), countdown=10)
+
+
+@shared_task(name="app.tasks.deletions.purge_deleted_files")
+def purge_deleted_files(file_ids: list[int] | None = None):
+    """
+    Purge tombstoned files: rows first, then their objects in DeleteObjects batches.
+    Objects S3 refuses are retried by delete_objects; what still fails after that
+    is left for reconcile_storage. With no `file_ids`, sweeps every tombstone.
+    """
+    storage = S3Storage()
+    purged = 0
+    while True:
+        count, keys = asyncio.run(_purge_batch(file_ids))
+        purged += count
+        if keys:
+            _delete_keys(storage, keys)
+        if count < settings.PURGE_BATCH_SIZE:
+            break
+    if purged:
+        log.warning(f"[purge] files={purged}")
+    return {"purged": purged}
+
+
+@shared_task(
+    name="app.tasks.deletions.delete_objects",
+    bind=True,
+    max_retries=settings.PURGE_MAX_RETRIES,
+)
+def delete_objects(self, keys: list[str]):
+    """Delete objects whose rows are gone already, retrying the ones S3 refused with backoff."""
+    failed = [e["Key"] for e in S3Storage().delete_many(keys)]
+    if failed:
+        if self.request.retries >= self.max_retries:
+            log.error(f"[purge] giving up on {len(failed)} objects, e.g. {failed[0]}")
+            return {"failed": len(failed)}
+        raise self.retry(args=(failed,), countdown=10 * 2 ** self.request.retries)
+    return {"deleted": len(keys)}
+
+
+#-----------Reconcile bucket vs files-----------------
+
+def _thumb_base(key: str) -> str:
+    # renditions live next to their original as "<key>@thumb_<name>"
+    return key.split("@thumb_", 1)[0]
+
+
+async def _reconcile_prefix(storage: S3Storage, prefix: str, cutoff: datetime) -> tuple[int, int]:
+    """
+    Diff one owner's prefix, or the blob prefix, against the database. Objects nothing references are
+    deleted; rows whose object is gone are tombstoned for the purge.
+    Both only once older than `cutoff`, so uploads in flight are left alone.
+    Returns (orphaned objects, dangling rows).
+    """
+    objects = storage.list_objects(prefix)
+    existing = {obj["Key"] for obj in objects}
+
+    async with worker_session_maker() as session:
+        owner_id = prefix.rstrip("/")
+        files = []
+        if owner_id.isdigit():
+            files = (await session.execute(
+                select(
+                    File.id, File.storage_key, File.object_key, File.thumbnail_key, File.renditions, File.blob_id,
+                    File.uploaded_at, File.deleted_at,
+                ).where(File.owner_id == int(owner_id))
+            )).all()
+        blobs = (await session.execute(
+            select(Blob.id, Blob.storage_key, Blob.created_at).where(Blob.storage_key.startswith(prefix, autoescape=True))
+        )).all()
+
+        # a deduplicated file's upload key is garbage once its content is in a blob
+        referenced = {f.object_key or f.storage_key for f in files} | {b.storage_key for b in blobs}
+        for f in files:
+            referenced.update((f.renditions or {}).values())
+            if f.thumbnail_key:
+                referenced.add(f.thumbnail_key)
+        orphans = [
+            obj["Key"] for obj in objects
+            if obj["LastModified"] < cutoff
+            and obj["Key"] not in referenced
+            and _thumb_base(obj["Key"]) not in referenced
+        ]
+
+        dangling_files = [
+            f.id for f in files
+            if f.blob_id is None and f.deleted_at is None and f.uploaded_at < cutoff and f.storage_key not in existing
+        ]
+        dangling_blobs = [b.id for b in blobs if b.created_at < cutoff and b.storage_key not in existing]
+        dangling = 0
+        if dangling_files or dangling_blobs:
+            result = await session.execute(
+                update(File)
+                .where(
+                    or_(File.id.in_(dangling_files), File.blob_id.in_(dangling_blobs)),
+                    File.deleted_at.is_(None),
+                )
+                .values(deleted_at=datetime.now(timezone.utc))
+                .returning(File.owner_id, File.size)
+                .execution_options(synchronize_session=False)
+            )
+            tombstoned = result.all()
+            await add_usage(session, usage_deltas(tombstoned))
+            await session.commit()
+            dangling = len(tombstoned)
+
+    if orphans:
+        _delete_keys(storage, orphans)
+    return len(orphans), dangling
+
+
+async def _recount_blobs(storage: S3Storage, cutoff: datetime) -> int:
+    """
+    Reset blobs.refcount to the number of files referencing each blob and free the
+    blobs nothing references, e.g. after a user was deleted and their files went
+    with the cascade. Returns how many refcounts were wrong.
+    """
+    fixed = 0
+    last_id = 0
+    async with worker_session_maker() as session:
+        while True:
+            # finalize and purge change refcount and files.blob_id in one transaction with
+            # this lock held, so the count below can't miss one of theirs
+            ids = (await session.execute(
+                select(Blob.id).where(Blob.id > last_id).order_by(Blob.id)
+                .limit(settings.RECONCILE_BLOB_BATCH).with_for_update()
+            )).scalars().all()
+            if not ids:
+                return fixed
+            last_id = ids[-1]
+
+            actual = (
+                select(Blob.id.label("blob_id"), func.count(File.id).label("refcount"))
+                .select_from(Blob)
+                .outerjoin(File, File.blob_id == Blob.id)
+                .where(Blob.id.in_(ids))
+                .group_by(Blob.id)
+                .subquery()
+            )
+            result = await session.execute(
+                update(Blob)
+                .where(Blob.id == actual.c.blob_id, Blob.refcount != actual.c.refcount)
+                .values(refcount=actual.c.refcount)
+                .returning(Blob.id)
+                .execution_options(synchronize_session=False)
+            )
+            fixed += len(result.all())
+            freed = (await session.execute(
+                delete(Blob)
+                .where(Blob.id.in_(ids), Blob.refcount <= 0, Blob.created_at < cutoff)
+                .returning(Blob.storage_key)
+                .execution_options(synchronize_session=False)
+            )).scalars().all()
+            await session.commit()
+            # renditions of freed blobs are orphans now, the prefix pass removes them
+            if freed:
+                _delete_keys(storage, list(freed))
+
+
+async def _reconcile(storage: S3Storage, cutoff: datetime) -> dict:
+    try:
+        blobs_fixed = await _recount_blobs(storage, cutoff)
+    except Exception:
+        log.exception("[reconcile] blob recount failed")
+        blobs_fixed = None
+
+    async with worker_session_maker() as session:
+        user_ids = (await session.execute(select(User.id))).scalars().all()
+    # prefixes of deleted users are in the listing but not in users. Only owner ids and
+    # the blob prefix are ours, anything else in the bucket is left alone
+    prefixes = {f"{user_id}/" for user_id in user_ids} | {
+        prefix for prefix in storage.list_common_prefixes() if prefix.rstrip("/").isdigit()
+    }
+    prefixes.add(BLOB_PREFIX)
+
+    orphans = dangling = 0
+    for prefix in sorted(prefixes):
+        try:
+            o, d = await _reconcile_prefix(storage, prefix, cutoff)
+        except Exception:
+            log.exception(f"[reconcile] prefix={prefix} failed")
+            continue
+        orphans += o
+        dangling += d
+    return {"prefixes": len(prefixes), "orphans": orphans, "dangling": dangling, "blobs_fixed": blobs_fixed}
+
+
+@shared_task(name="app.tasks.deletions.reconcile_storage")
+def reconcile_storage():
+    """
+    Periodic safety net for deletes that didn't complete: diff the bucket listing,
+    one owner prefix at a time, against files and blobs.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.RECONCILE_GRACE_HOURS)
+    stats = asyncio.run(_reconcile(S3Storage(), cutoff))
+    log.warning(f"[reconcile] {stats}")
+    return stats
@@ -1,15 +1,109 @@
 from celery import shared_task
 from PIL import Image, UnidentifiedImageError, ImageFile
-import io, asyncio, requests
+import io, os, time, asyncio, requests, tempfile
 import logging
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
-from app.database import async_session_maker
+from app.config import THUMBNAIL_FORMATS, settings
+
+from sqlalchemy import select, update
+
+from app.database import worker_session_maker
 from app.models.file import File
+from app.storage.s3 import S3Storage
 from app.tasks.celery_app import celery_app
 
 log = logging.getLogger(__name__)
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+SNIFF_BYTES = 16
+# stages timed per job, stored as "<stage>_ms" in files.thumbnail_timings
+THUMBNAIL_STAGES = ("queue", "download", "decode", "encode", "upload")
+DOWNLOAD_CHUNK = 256 * 1024
+# what a file copies from another file with the same content instead of getting its own job
+THUMBNAIL_FIELDS = (
+    "renditions", "thumbnail_key", "thumbnail_status", "thumbnail_error", "thumbnail_size",
+    "thumbnail_requested_at", "thumbnail_completed_at", "thumbnail_timings",
+)
+
+# format -> (Pillow format, content type, key extension, save options)
+RENDITION_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", "jpg", {"quality": 82, "optimize": True}),
+    "webp": ("WEBP", "image/webp", "webp", {"quality": 80, "method": 4}),
+}
+assert set(RENDITION_FORMATS) == set(THUMBNAIL_FORMATS)
+
+
+def rendition_specs() -> list[tuple[int, str]]:
+    """(max side, format) pairs from settings.THUMBNAIL_RENDITIONS"""
+    specs = []
+    for item in settings.THUMBNAIL_RENDITIONS:
+        size, fmt = item.split(":")
+        specs.append((int(size), fmt.strip().lower()))
+    return specs
+
+
+def rendition_name(size: int, fmt: str) -> str:
+    return f"{size}.{RENDITION_FORMATS[fmt][2]}"
+
+
+def rendition_key(storage_key: str, size: int, fmt: str) -> str:
+    return f"{storage_key}@thumb_{rendition_name(size, fmt)}"
+
+
+def wants_thumbnails(db_file: File) -> bool:
+    return bool(rendition_specs()) and db_file.content_type.startswith("image/")
+
+
+def queue_thumbnail(db_file: File) -> None:
+    """Leave the file's resize job to dispatch_thumbnails, which batches it with other requests' jobs."""
+    db_file.thumbnail_status = "queued"
+    db_file.thumbnail_requested_at = datetime.now(timezone.utc)
+    db_file.thumbnail_completed_at = None
+    db_file.thumbnail_error = None
+
+
+def thumbnail_job(storage, db_file: File, requested_at: datetime | None = None) -> dict | None:
+    """
+    Point the row at its rendition keys and build the resize task kwargs, for images only.
+    `storage` is anything with presigned_put/presigned_get (S3Storage, AsyncS3Storage).
+    `requested_at` is when the job was first asked for, if it waited in the files queue.
+    """
+    if not wants_thumbnails(db_file):
+        return None
+    specs = rendition_specs()
+
+    keys, targets = {}, []
+    for size, fmt in specs:
+        key = rendition_key(db_file.physical_key, size, fmt)
+        keys[rendition_name(size, fmt)] = key
+        put_url = storage.presigned_put(key=key, content_type=RENDITION_FORMATS[fmt][1], expires_in=600)
+        targets.append({"size": size, "format": fmt, "key": key, "put_url": put_url})
+    db_file.renditions = keys
+    db_file.thumbnail_key = keys.get("256.jpg") or targets[0]["key"]
+    # URLs are only handed out once the worker reports the renditions exist
+    requested_at = requested_at or datetime.now(timezone.utc)
+    db_file.thumbnail_status = "pending"
+    db_file.thumbnail_requested_at = requested_at
+    db_file.thumbnail_completed_at = None
+    db_file.thumbnail_error = None
+
+    get_url = storage.presigned_get(key=db_file.physical_key, expires_in=600)
+    return {
+        "file_id": db_file.id,
+        "get_url": get_url,
+        "renditions": targets,
+        "queued_at": requested_at.timestamp(),
+    }
+
+
+def publish_jobs(jobs: list[dict]) -> None:
+    """Publish resize jobs over one broker connection, THUMB_BATCH_SIZE per resize_image_batch message."""
+    with celery_app.producer_or_acquire() as producer:
+        for start in range(0, len(jobs), settings.THUMB_BATCH_SIZE):
+            resize_image_batch.apply_async((jobs[start:start + settings.THUMB_BATCH_SIZE],), producer=producer)
 
 
 def _sniff(b: bytes) -> str:
@@ -28,66 +122,304 @@ def _sniff(b: bytes) -> str:
 
 
 
-@shared_task(name="app.tasks.thumbnails.resize_image")
-def resize_image(file_id: int, get_url: str, put_url: str, thumb_key: str):
+_http: requests.Session | None = None
+_http_pid: int | None = None
+
 
+def _session() -> requests.Session:
     """
-    Create a 256px JPEG thumbnail
+    Keep-alive HTTP session shared by every task in this worker process.
+    Built lazily and per pid, so prefork children don't inherit the parent's sockets.
     """
-    try:
-        r = requests.get(get_url, timeout=60)
-        r.raise_for_status()
-        data = r.content
+    global _http, _http_pid
+    if _http is None or _http_pid != os.getpid():
+        _http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.THUMB_HTTP_POOL_SIZE)
+        _http.mount("https://", adapter)
+        _http.mount("http://", adapter)
+        _http_pid = os.getpid()
+    return _http
 
-        ct  = r.headers.get("Content-Type")
-        enc = r.headers.get("Content-Encoding")
-        
-        kind = _sniff(data)
 
-        log.warning(f"[thumb] GET ok len={len(data)} ct={ct} enc={enc} kind={kind}")
+def _fetch_original(get_url: str):
+    """
+    Stream the original into a spool (memory up to THUMB_SPOOL_MAX_BYTES, a temp file beyond).
+    The format is sniffed from the first chunk, and a non-image stops the download right there.
+    Returns (kind, spool or None, info).
+    """
+    with _session().get(get_url, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        info = {"ct": r.headers.get("Content-Type"), "enc": r.headers.get("Content-Encoding")}
 
+        chunks = r.iter_content(chunk_size=DOWNLOAD_CHUNK)
+        head = b""
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= SNIFF_BYTES:
+                break
+
+        kind = _sniff(head)
         if kind in ("xml/html", "unknown"):
-            sample = data[:64].hex()
-            log.warning(f"[thumb] suspicious head={sample}")
-            return {"ok": False, "reason": f"bad_content:{kind}"}
-
-        # (bio + verify) быстрая проверка целостности чтобы отловить битые или обрезанные файлы
-       
-        try:
-            Image.open(io.BytesIO(data)).verify()
-        except UnidentifiedImageError:
-            log.warning("[thumb] verify: unidentified_image")
-            return {"ok": False, "reason": "unidentified_image"}
-        
-
-        
-        img = Image.open(io.BytesIO(data)).convert("RGB")
-        img.thumbnail((256, 256))
-
-        output = io.BytesIO()
-        img.save(output, format="JPEG", quality=82, optimize=True)
-        output.seek(0)
+            info["sample"] = head[:64].hex()
+            return kind, None, info
+
+        spool = tempfile.SpooledTemporaryFile(max_size=settings.THUMB_SPOOL_MAX_BYTES)
+        spool.write(head)
+        for chunk in chunks:
+            spool.write(chunk)
+        info["len"] = spool.tell()
+        spool.seek(0)
+        return kind, spool, info
+
+
+def _decode(fp, max_side: int) -> Image.Image:
+    """
+    Decode once, at the smallest scale that still covers `max_side`.
+    For JPEG, draft() makes libjpeg downscale in the DCT domain (1/2, 1/4, 1/8)
+    so the full-size bitmap is never built.
+    """
+    img = Image.open(fp)
+    img.draft("RGB", (max_side, max_side))
+    img = img.convert("RGB")
+    img.thumbnail((max_side, max_side))
+    return img
+
+
+def _render(img: Image.Image, targets: list[dict]) -> dict[str, bytes]:
+    """
+    Encode every target from a downscale cascade: each size is resized from the
+    previous, larger one rather than from the original. Returns key -> encoded bytes.
+    """
+    encoded = {}
+    for size in sorted({t["size"] for t in targets}, reverse=True):
+        img.thumbnail((size, size))
+        for t in targets:
+            if t["size"] != size:
+                continue
+            pil_format, _, _, options = RENDITION_FORMATS[t["format"]]
+            output = io.BytesIO()
+            img.save(output, format=pil_format, **options)
+            encoded[t["key"]] = output.getvalue()
+    return encoded
+
+
+def _upload(target: dict, data: bytes) -> None:
+    put_resp = _session().put(
+        target["put_url"],
+        data=data,
+        headers={"Content-Type": RENDITION_FORMATS[target["format"]][1], "Cache-Control": "public, max-age=31536000"},
+        timeout=60,
+    )
+    log.warning(f"[thumb] PUT {target['key']} status={put_resp.status_code} text={put_resp.text[:200]}")
+    put_resp.raise_for_status()
+
+
+def _process(file_id: int, get_url: str, targets: list[dict], queued_at: float | None = None) -> dict:
+    timings = {}
+    if queued_at:
+        timings["queue_ms"] = round((time.time() - queued_at) * 1000, 1)
+    spool = None
+    try:
+        started = time.perf_counter()
+
+        def stage(name: str) -> None:
+            nonlocal started
+            now = time.perf_counter()
+            timings[f"{name}_ms"] = round((now - started) * 1000, 1)
+            started = now
+
+        kind, spool, info = _fetch_original(get_url)
+        stage("download")
+
+        log.warning(f"[thumb] GET ok file={file_id} len={info.get('len')} ct={info['ct']} enc={info['enc']} kind={kind}")
+
+        if spool is None:
+            log.warning(f"[thumb] suspicious head={info['sample']}")
+            return {"ok": False, "reason": f"bad_content:{kind}", "timings": timings}
+
+        # a broken or truncated file fails here, in the only decode pass
+        img = _decode(spool, max(t["size"] for t in targets))
+        stage("decode")
+        encoded = _render(img, targets)
+        stage("encode")
 
         # Upload to S3
-        put_resp = requests.put(
-            put_url,
-            data= output.getvalue(),
-            headers={"Content-Type": "image/jpeg", "Cache-Control": "public, max-age=31536000"},
-            timeout=60,
-        )
-        log.warning(f"[thumb] PUT status={put_resp.status_code} text={put_resp.text[:200]}")
-        put_resp.raise_for_status()
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            list(pool.map(lambda t: _upload(t, encoded[t["key"]]), targets))
+        stage("upload")
 
-        return {"ok": True, "thumb_key": thumb_key, "size": output.tell()}
+        return {"ok": True, "renditions": {key: len(data) for key, data in encoded.items()}, "timings": timings}
 
     except UnidentifiedImageError:
         log.warning("[thumb] open: unidentified_image")
-        return {"ok": False, "reason": "unidentified_image"}
+        return {"ok": False, "reason": "unidentified_image", "timings": timings}
 
     except Exception as e:
         log.exception(f"[thumb] ERROR:")
-        return {"ok": False, "reason": f"http_error: {e}"}
-    
-    
+        return {"ok": False, "reason": f"http_error: {e}", "timings": timings}
+
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+async def _save_results(results: list[tuple[int, dict]]) -> None:
+    """Write job outcomes back to their files rows, all in one short transaction."""
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "id": file_id,
+            "thumbnail_status": "ready" if result["ok"] else "failed",
+            "thumbnail_error": None if result["ok"] else result["reason"][:500],
+            "thumbnail_size": sum(result.get("renditions", {}).values()) or None,
+            "thumbnail_timings": result.get("timings"),
+            "thumbnail_completed_at": now,
+        }
+        for file_id, result in results
+    ]
+    async with worker_session_maker() as session:
+        await session.execute(update(File), rows)
+        # files deduplicated onto the same content are waiting on this job too
+        for row in rows:
+            values = {k: v for k, v in row.items() if k != "id"}
+            source = select(File.blob_id).where(File.id == row["id"]).scalar_subquery()
+            await session.execute(
+                update(File)
+                .where(File.blob_id == source, File.thumbnail_status == "pending")
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
+
+
+def _record(results: list[tuple[int, dict]]) -> None:
+    try:
+        asyncio.run(_save_results(results))
+    except Exception:
+        # the thumbnails themselves are in S3 already, a lost status write shouldn't fail the task
+        log.exception(f"[thumb] failed to save status for {len(results)} files")
+
+
+def _targets(put_url: str | None, thumb_key: str | None, renditions: list[dict] | None) -> list[dict]:
+    # older messages carry a single 256px JPEG as put_url/thumb_key
+    return renditions or [{"size": 256, "format": "jpeg", "key": thumb_key, "put_url": put_url}]
+
+
+@shared_task(name="app.tasks.thumbnails.resize_image")
+def resize_image(file_id: int, get_url: str, put_url: str | None = None, thumb_key: str | None = None,
+                 renditions: list[dict] | None = None, queued_at: float | None = None):
+
+    """
+    Decode the original once and upload all of its renditions.
+    `renditions` are {"size", "format", "key", "put_url"} dicts.
+    """
+    result = _process(file_id, get_url, _targets(put_url, thumb_key, renditions), queued_at)
+    _record([(file_id, result)])
+    return result
+
+
+@shared_task(name="app.tasks.thumbnails.resize_image_batch")
+def resize_image_batch(jobs: list[dict]):
+    """
+    Many resize_image jobs in one message, for bursts of small images where
+    per-task overhead outweighs the resize itself.
+    Jobs share the pooled HTTP session and run on THUMB_BATCH_WORKERS threads;
+    Pillow releases the GIL while decoding, resizing and encoding.
+    (Celery prefork children are daemonic and can't start a process pool.)
+    """
+    def run(job: dict) -> dict:
+        targets = _targets(job.get("put_url"), job.get("thumb_key"), job.get("renditions"))
+        return _process(job["file_id"], job["get_url"], targets, job.get("queued_at"))
+
+    with ThreadPoolExecutor(max_workers=settings.THUMB_BATCH_WORKERS) as pool:
+        results = list(pool.map(run, jobs))
+    _record([(job["file_id"], result) for job, result in zip(jobs, results)])
+    return {"ok": sum(r["ok"] for r in results), "failed": sum(not r["ok"] for r in results)}
+
 
+async def _requeue_batch(storage: S3Storage, cutoff: datetime) -> int:
+    async with worker_session_maker() as session:
+        rows = (await session.execute(
+            select(File)
+            .where(File.thumbnail_status == "pending", File.thumbnail_requested_at < cutoff)
+            .order_by(File.thumbnail_requested_at)
+            .limit(settings.THUMB_REQUEUE_BATCH)
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        # fresh URLs and requested_at, so the row isn't picked up again right away
+        jobs = [job for job in (thumbnail_job(storage, f) for f in rows) if job]
+        await session.commit()
+    if jobs:
+        publish_jobs(jobs)
+    return len(rows)
 
+
+@shared_task(name="app.tasks.thumbnails.requeue_stale_thumbnails")
+def requeue_stale_thumbnails():
+    """
+    Publish again the jobs of files pending for longer than THUMB_PENDING_TIMEOUT_MINUTES:
+    jobs lost between commit and publish (API crash, broker down) or dropped by the broker.
+    A job that is merely slow runs twice, which only rewrites the same renditions.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.THUMB_PENDING_TIMEOUT_MINUTES)
+    storage = S3Storage()
+    requeued = 0
+    while True:
+        count = asyncio.run(_requeue_batch(storage, cutoff))
+        requeued += count
+        if count < settings.THUMB_REQUEUE_BATCH:
+            break
+    if requeued:
+        log.warning(f"[thumb] requeued={requeued}")
+    return {"requeued": requeued}
+
+
+async def _dispatch_batch(storage: S3Storage) -> int:
+    async with worker_session_maker() as session:
+        rows = (await session.execute(
+            select(File)
+            .where(File.thumbnail_status == "queued")
+            .order_by(File.thumbnail_requested_at)
+            .limit(settings.THUMB_DISPATCH_BATCH)
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        jobs, owners = [], {}
+        for f in rows:
+            owner = owners.get(f.blob_id) if f.blob_id is not None else None
+            if owner:
+                # same content as a row claimed with it: that job's results resolve this row too
+                for field in THUMBNAIL_FIELDS:
+                    setattr(f, field, getattr(owner, field))
+                continue
+            job = thumbnail_job(storage, f, requested_at=f.thumbnail_requested_at)
+            if not job:
+                # renditions were switched off since it was queued
+                f.thumbnail_status = None
+                continue
+            jobs.append(job)
+            if f.blob_id is not None:
+                owners[f.blob_id] = f
+        await session.commit()
+    # a failed publish leaves the rows pending, for requeue_stale_thumbnails
+    if jobs:
+        publish_jobs(jobs)
+    return len(rows)
+
+
+@shared_task(name="app.tasks.thumbnails.dispatch_thumbnails")
+def dispatch_thumbnails():
+    """
+    Publish the resize jobs the API queued in files rows: those of single uploads and
+    what was left of a request's jobs after its full THUMB_BATCH_SIZE messages. Jobs of
+    every request since the last run go out together, in full resize_image_batch
+    messages. Runs every THUMB_DISPATCH_INTERVAL_SECONDS; overlapping runs skip each
+    other's rows.
+    """
+    storage = S3Storage()
+    dispatched = 0
+    while True:
+        count = asyncio.run(_dispatch_batch(storage))
+        dispatched += count
+        if count < settings.THUMB_DISPATCH_BATCH:
+            break
+    return {"dispatched": dispatched}
@@ -0,0 +1,43 @@
+from celery import shared_task
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, or_, select
+import asyncio
+import logging
+
+from app.config import settings
+from app.database import worker_session_maker
+from app.models.refresh_token import RefreshToken
+
+log = logging.getLogger(__name__)
+
+
+async def _prune(now: datetime) -> int:
+    revoked_before = now - timedelta(hours=settings.REFRESH_TOKEN_REVOKED_RETENTION_HOURS)
+    doomed = (
+        select(RefreshToken.id)
+        .where(or_(
+            RefreshToken.expires_at < now,
+            RefreshToken.revoked & (RefreshToken.revoked_at < revoked_before),
+        ))
+        .limit(settings.REFRESH_TOKEN_PRUNE_BATCH)
+    )
+    total = 0
+    async with worker_session_maker() as session:
+        while True:
+            # one short transaction per batch, so locks and WAL bursts stay small
+            result = await session.execute(delete(RefreshToken).where(RefreshToken.id.in_(doomed)))
+            await session.commit()
+            total += result.rowcount
+            if result.rowcount < settings.REFRESH_TOKEN_PRUNE_BATCH:
+                return total
+
+
+@shared_task(name="app.tasks.tokens.prune_refresh_tokens")
+def prune_refresh_tokens():
+    """
+    Delete expired refresh tokens, and revoked ones older than
+    REFRESH_TOKEN_REVOKED_RETENTION_HOURS, REFRESH_TOKEN_PRUNE_BATCH rows at a time.
+    """
+    pruned = asyncio.run(_prune(datetime.now(timezone.utc)))
+    log.warning(f"[tokens] pruned={pruned}")
+    return {"pruned": pruned}
@@ -0,0 +1,47 @@
+from celery import shared_task
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete
+from botocore.exceptions import ClientError
+import asyncio
+import logging
+
+from app.config import settings
+from app.database import worker_session_maker
+from app.models.multipart_upload import MultipartUpload
+from app.storage.s3 import S3Storage
+
+log = logging.getLogger(__name__)
+
+
+async def _forget_uploads(cutoff: datetime) -> int:
+    async with worker_session_maker() as session:
+        result = await session.execute(delete(MultipartUpload).where(MultipartUpload.created_at < cutoff))
+        await session.commit()
+        return result.rowcount
+
+
+@shared_task(name="app.tasks.uploads.abort_stale_multipart_uploads")
+def abort_stale_multipart_uploads():
+    """
+    Abort multipart uploads nobody completed within MULTIPART_UPLOAD_TTL_HOURS,
+    so their parts stop costing storage, and drop their tracking rows.
+    The bucket listing is the source of truth: uploads we lost track of are aborted too,
+    but only under owner id prefixes, like reconcile_storage. The rest of the bucket isn't ours.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.MULTIPART_UPLOAD_TTL_HOURS)
+    storage = S3Storage()
+
+    aborted = 0
+    for upload in storage.list_multipart_uploads():
+        owner_id, _, rest = upload["Key"].partition("/")
+        if not (owner_id.isdigit() and rest) or upload["Initiated"] >= cutoff:
+            continue
+        try:
+            storage.abort_multipart_upload(key=upload["Key"], upload_id=upload["UploadId"])
+            aborted += 1
+        except ClientError:
+            log.exception(f"[multipart] abort failed key={upload['Key']}")
+
+    forgotten = asyncio.run(_forget_uploads(cutoff))
+    log.warning(f"[multipart] aborted={aborted} forgotten={forgotten}")
+    return {"aborted": aborted, "forgotten": forgotten}
@@ -0,0 +1,77 @@
+from celery import shared_task
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import asyncio
+import logging
+
+from app.config import settings
+from app.database import worker_session_maker
+from app.models.file import File
+from app.models.user import User
+from app.models.user_usage import UserUsage
+
+log = logging.getLogger(__name__)
+
+
+async def _reconcile_batch(session, user_ids: list[int]) -> int:
+    """Recount one batch of users and fix the totals that drifted. Returns how many did."""
+    await session.execute(
+        pg_insert(UserUsage).values([{"user_id": user_id} for user_id in user_ids]).on_conflict_do_nothing()
+    )
+    # wait for in-flight finalizes/deletes of these users and hold them off until commit,
+    # so the count below sees their files and nothing changes before it is written
+    await session.execute(
+        select(UserUsage.user_id).where(UserUsage.user_id.in_(user_ids)).order_by(UserUsage.user_id).with_for_update()
+    )
+    actual = (
+        select(
+            User.id.label("user_id"),
+            func.coalesce(func.sum(File.size), 0).label("bytes"),
+            func.count(File.id).label("files"),
+        )
+        .select_from(User)
+        .outerjoin(File, and_(File.owner_id == User.id, File.deleted_at.is_(None)))
+        .where(User.id.in_(user_ids))
+        .group_by(User.id)
+        .subquery()
+    )
+    result = await session.execute(
+        update(UserUsage)
+        .where(
+            UserUsage.user_id == actual.c.user_id,
+            or_(UserUsage.bytes != actual.c.bytes, UserUsage.files != actual.c.files),
+        )
+        .values(bytes=actual.c.bytes, files=actual.c.files, updated_at=func.now())
+        .returning(UserUsage.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    drifted = len(result.all())
+    await session.commit()
+    return drifted
+
+
+async def _reconcile() -> dict:
+    users = drifted = 0
+    last_id = 0
+    async with worker_session_maker() as session:
+        while True:
+            user_ids = (await session.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(settings.USAGE_RECONCILE_BATCH)
+            )).scalars().all()
+            if not user_ids:
+                break
+            drifted += await _reconcile_batch(session, user_ids)
+            users += len(user_ids)
+            last_id = user_ids[-1]
+    return {"users": users, "drifted": drifted}
+
+
+@shared_task(name="app.tasks.usage.reconcile_usage")
+def reconcile_usage():
+    """
+    Recount user_usage from files, USAGE_RECONCILE_BATCH users per transaction.
+    Catches drift from anything that changed files without going through the routes.
+    """
+    stats = asyncio.run(_reconcile())
+    log.warning(f"[usage] {stats}")
+    return stats
@@ -0,0 +1,81 @@
+"""
+Throughput and memory of zip_stream building a large archive from the local S3
+stand-in, the way POST /files/archive streams it. RSS is sampled as the archive
+grows and should stay flat. The stand-in runs in a child process, so its memory
+isn't counted.
+
+    python -m benchmarks.archive_stream --total-gb 10 --files 100 --s3-latency-ms 20
+
+With --output the archive is written there and checked with zipfile afterwards.
+"""
+import argparse
+import asyncio
+import os
+import time
+import zipfile
+from datetime import datetime, timezone
+
+from benchmarks.common import peak_rss_mb
+from benchmarks.s3_standin import s3_standin
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+async def run(files: int, size: int, output: str | None) -> None:
+    # boto3 reads the endpoint when the shared client is built
+    from app.config import settings
+    from app.storage.archive import ArchiveEntry, zip_stream
+    from app.storage.s3 import AsyncS3Storage
+
+    entries = [
+        ArchiveEntry(name=f"file-{n:05d}.bin", key=f"1/file-{n:05d}.bin", modified=datetime.now(timezone.utc))
+        for n in range(files)
+    ]
+    out = open(output, "wb") if output else None
+    print(
+        f"chunk {settings.ARCHIVE_CHUNK_BYTES // 1024} KiB, read-ahead {settings.ARCHIVE_READ_AHEAD} objects, "
+        f"{settings.ARCHIVE_BUFFER_CHUNKS} chunks buffered each; RSS before {_rss_mb():.0f} MiB"
+    )
+    expected = files * size
+    total = 0
+    first_byte = None
+    next_report = 0.1
+    start = time.perf_counter()
+    async for data in zip_stream(AsyncS3Storage(), entries):
+        if first_byte is None and data:
+            first_byte = time.perf_counter() - start
+        total += len(data)
+        if out:
+            out.write(data)
+        if total >= next_report * expected:
+            print(f"  {total / 2 ** 30:6.2f} GiB  RSS {_rss_mb():.0f} MiB")
+            next_report += 0.1
+    elapsed = time.perf_counter() - start
+    if out:
+        out.close()
+
+    print(
+        f"{total / 2 ** 30:.2f} GiB in {elapsed:.1f}s: {total / 2 ** 20 / elapsed:.0f} MiB/s, "
+        f"first byte after {first_byte * 1000:.0f}ms, peak RSS {peak_rss_mb():.0f} MiB"
+    )
+    if output:
+        with zipfile.ZipFile(output) as archive:
+            bad = archive.testzip()
+            sizes = {info.file_size for info in archive.infolist()}
+            print(f"{output}: {len(archive.infolist())} entries of {sizes} bytes, CRC errors: {bad}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--total-gb", type=float, default=10)
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--s3-latency-ms", type=float, default=20)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    size = int(args.total_gb * 2 ** 30 // args.files)
+    with s3_standin(size=size, latency=args.s3_latency_ms / 1000) as endpoint:
+        os.environ["AWS_ENDPOINT_URL_S3"] = endpoint
+        asyncio.run(run(args.files, size, args.output))
@@ -0,0 +1,70 @@
+"""
+DB queries and connection checkouts per authenticated request in get_current_user:
+without the principal cache (every request looks the user up, as before), with
+it, and with AUTH_ROLE_CLAIMS trusting the token's role/email claims.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.auth_queries --users 100 --requests 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import count_statements, database_url, percentiles, reset_schema
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import settings
+from app.core.deps import get_current_user
+from app.core.principal import principal_cache
+from app.core.security import create_access_token
+from app.models.user import User
+
+
+async def run(url: str, users: int, requests: int) -> None:
+    await reset_schema(url)
+    engine = create_async_engine(url)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        rows = [User(email=f"user{n}@example.com", hashed_password="x") for n in range(users)]
+        session.add_all(rows)
+        await session.commit()
+    tokens = [
+        create_access_token({"sub": str(u.id), "role": u.role, "email": u.email}) for u in rows
+    ]
+    # a few busy clients and a long tail, like real traffic
+    rng = random.Random(0)
+    replay = rng.choices(tokens, weights=[1 / (rank + 1) for rank in range(users)], k=requests)
+
+    statements = count_statements(engine)
+    checkouts = []
+    event.listen(engine.sync_engine, "checkout", lambda *args: checkouts.append(1))
+
+    for mode in ("no cache", "principal cache", "role claims"):
+        settings.AUTH_ROLE_CLAIMS = mode == "role claims"
+        principal_cache.clear()
+        statements.clear()
+        checkouts.clear()
+        samples = []
+        for token in replay:
+            if mode == "no cache":
+                principal_cache.clear()
+            start = time.perf_counter()
+            async with session_maker() as session:
+                await get_current_user(token, session)
+            samples.append(time.perf_counter() - start)
+        print(
+            f"{mode:16} {len(statements) / requests:.3f} queries/request  "
+            f"{len(checkouts) / requests:.3f} checkouts/request  {percentiles(samples)}"
+        )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(run(database_url(), args.users, args.requests))
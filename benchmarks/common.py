@@ -0,0 +1,67 @@
+"""
+Shared setup for the scripts in this package. Import it before anything from `app`:
+it fills in the settings a benchmark doesn't care about.
+
+Scripts that need PostgreSQL read BENCH_DATABASE_URL (postgresql+asyncpg://...)
+and drop and recreate the schema there, so never point it at real data.
+"""
+import os
+import resource
+import statistics
+import sys
+
+for name, value in {
+    "DB_HOST": "localhost", "DB_PORT": "5432", "DB_USER": "postgres", "DB_PASS": "postgres", "DB_NAME": "file_api",
+    "SECRET_KEY": "bench-secret", "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "15", "REFRESH_TOKEN_EXPIRE_DAYS": "7",
+    "S3_BUCKET": "bench-bucket", "S3_REGION": "eu-central-1",
+    "S3_ACCESS_KEY_ID": "AKIAEXAMPLE", "S3_SECRET_ACCESS_KEY": "secret",
+    "CELERY_BROKER_URL": "memory://",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+def database_url() -> str:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("BENCH_DATABASE_URL is not set")
+    return url
+
+
+async def reset_schema(url: str) -> None:
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.database import Base
+    from app.models import blob, file, multipart_upload, refresh_token, user, user_usage  # registers the tables
+
+    engine = create_async_engine(url, poolclass=NullPool)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+def count_statements(engine) -> list[str]:
+    """Statements `engine` sends from now on, appended as they run."""
+    from sqlalchemy import event
+
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def percentiles(samples: list[float]) -> str:
+    """p50/p90/p99/max of `samples` (seconds), in milliseconds."""
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return (
+        f"p50 {cuts[49] * 1000:.2f}ms  p90 {cuts[89] * 1000:.2f}ms  "
+        f"p99 {cuts[98] * 1000:.2f}ms  max {max(samples) * 1000:.2f}ms"
+    )
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
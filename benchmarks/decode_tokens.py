@@ -0,0 +1,43 @@
+"""
+Access tokens decoded per second by decode_token, per JWT backend: cold (every
+token seen for the first time, so verified and cached) and warm (the same tokens
+replayed, answered from token_cache). Needs no network.
+
+    python -m benchmarks.decode_tokens --tokens 5000
+"""
+import argparse
+import time
+
+from benchmarks.common import percentiles
+
+from app.core import security
+
+
+def _pass(tokens) -> tuple[float, list[float]]:
+    samples = []
+    start = time.perf_counter()
+    for token in tokens:
+        t = time.perf_counter()
+        assert security.decode_token(token) is not None
+        samples.append(time.perf_counter() - t)
+    return len(tokens) / (time.perf_counter() - start), samples
+
+
+def run(count: int) -> None:
+    count = min(count, security.token_cache.maxsize)
+    for backend, (encode, decode, errors) in security.JWT_BACKENDS.items():
+        security._decode, security._decode_errors = decode, errors
+        tokens = [
+            encode({"sub": str(n), "role": "viewer", "exp": time.time() + 900, "iat": time.time()})
+            for n in range(count)
+        ]
+        security.token_cache.clear()
+        for phase in ("cold", "warm"):
+            rate, samples = _pass(tokens)
+            print(f"{backend:6} {phase:5} {rate:10,.0f} tokens/s  {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=5000, help="capped at TOKEN_CACHE_SIZE, so warm is all hits")
+    run(parser.parse_args().tokens)
@@ -0,0 +1,75 @@
+"""
+Latency of concurrent /files/finalize calls against the local S3 stand-in, with
+S3 calls awaited in AsyncS3Storage's thread pool against the same calls made
+directly on the event loop, as the sync S3Storage did before.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.finalize_latency \\
+        --requests 2000 --concurrency 50 --s3-latency-ms 20
+"""
+import argparse
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import database_url, percentiles, reset_schema
+from benchmarks.s3_standin import s3_standin
+
+
+async def run(url: str, requests: int, concurrency: int) -> None:
+    # boto3 reads the endpoint when the shared client is built, on first import of the routes
+    from fastapi import Response
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from app.models.user import User
+    from app.routes import files as files_route
+    from app.schemas.file import FinalizeRequest
+    from app.storage.s3 import AsyncS3Storage
+
+    class BlockingS3Storage(AsyncS3Storage):
+        """The same calls, made on the event loop thread."""
+
+        async def _run(self, fn, /, *args, **kwargs):
+            return fn(*args, **kwargs)
+
+    await reset_schema(url)
+    engine = create_async_engine(url, pool_size=concurrency, max_overflow=0)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        owner = User(email="bench@example.com", hashed_password="x")
+        session.add(owner)
+        await session.commit()
+    user = SimpleNamespace(id=owner.id)
+
+    for name, storage in (("blocking boto3", BlockingS3Storage()), ("thread pool", AsyncS3Storage())):
+        files_route.s3 = storage
+        gate = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def finalize(n):
+            async with gate:
+                start = time.perf_counter()
+                async with session_maker() as session:
+                    await files_route.finalize_upload(
+                        FinalizeRequest(key=f"{user.id}/{name}-{n}", filename="bench.txt"), Response(), session, user
+                    )
+                samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(finalize(n) for n in range(requests)))
+        elapsed = time.perf_counter() - start
+        print(f"{name:15} {requests / elapsed:7.1f} finalizes/s  {percentiles(samples)}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--s3-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+    url = database_url()
+    with s3_standin(size=1024, latency=args.s3_latency_ms / 1000) as endpoint:
+        os.environ["AWS_ENDPOINT_URL_S3"] = endpoint
+        asyncio.run(run(url, args.requests, args.concurrency))
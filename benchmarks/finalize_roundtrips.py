@@ -0,0 +1,89 @@
+"""
+Round trips and latency of the finalize row write: the INSERT ... ON CONFLICT in
+_upsert_rows, plus its UPDATE for keys that already have a row, against the SELECT,
+ORM insert/update and flush it replaced. Usage bookkeeping is switched off for both,
+so only the row write is compared.
+
+A new key takes one statement instead of two. A re-finalize takes two either
+way, but its INSERT is a wasted one, so it is the slower path here. Run it against
+a database across the network to see what the round trips are worth there.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.finalize_roundtrips --rows 2000
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import count_statements, database_url, percentiles, reset_schema
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models.file import File
+from app.models.user import User
+from app.routes import files as files_route
+from app.schemas.file import FinalizeRequest
+
+
+async def select_then_flush(session, user, uploads):
+    """The row write before the upsert, per key."""
+    for key, (payload, head) in uploads.items():
+        db_file = (await session.execute(select(File).where(File.storage_key == key))).scalar_one_or_none()
+        if not db_file:
+            db_file = File(owner_id=user.id, storage_key=key)
+            session.add(db_file)
+        for name, value in files_route._head_values(head, payload).items():
+            setattr(db_file, name, value)
+        await session.flush()
+
+
+async def upsert(session, user, uploads):
+    await files_route._upsert_rows(session, user, uploads)
+
+
+async def _noop(*args, **kwargs):
+    return 0, 0, 0
+
+
+async def run(url: str, rows: int) -> None:
+    await reset_schema(url)
+    files_route.add_usage = files_route.get_usage = _noop
+
+    engine = create_async_engine(url, pool_size=1)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        owner = User(email="bench@example.com", hashed_password="x")
+        session.add(owner)
+        await session.commit()
+    user = SimpleNamespace(id=owner.id)
+    statements = count_statements(engine)
+
+    for name, write in (("select+flush", select_then_flush), ("upsert", upsert)):
+        keys = [f"{user.id}/{name}-{n}" for n in range(rows)]
+        # re-finalized keys got new bytes, so the old path has an UPDATE to flush
+        for phase, etag in (
+            ("new key", "d41d8cd98f00b204e9800998ecf8427e"),
+            ("re-finalize", "9b2cf535f27731c974343645a3985328"),
+        ):
+            head = {"ContentLength": 1024, "ETag": f'"{etag}"', "ContentType": "text/plain"}
+            samples = []
+            statements.clear()
+            for key in keys:
+                uploads = {key: (FinalizeRequest(key=key, filename="bench.txt"), head)}
+                start = time.perf_counter()
+                async with session_maker() as session:
+                    await write(session, user, uploads)
+                    await session.commit()
+                samples.append(time.perf_counter() - start)
+            # BEGIN and COMMIT are round trips too but don't go through cursor_execute
+            print(f"{name:13} {phase:12} {len(statements) / rows:.1f} statements + commit  {percentiles(samples)}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(database_url(), args.rows))
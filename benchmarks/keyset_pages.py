@@ -0,0 +1,97 @@
+"""
+Per-page latency deep into /files/me and /files/admin/all: the keyset query the
+routes run now against the LIMIT/OFFSET query admin_list_all used to run, at the
+same depths. Seeds --rows files, half of them owned by one user.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.keyset_pages --rows 3000000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.common import database_url, reset_schema
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.pagination import encode_cursor, keyset
+from app.models.file import File
+
+LIMIT = 50
+SEED_BATCH = 500_000
+
+
+async def _seed(session_maker, rows: int) -> None:
+    async with session_maker() as session:
+        await session.execute(text(
+            "INSERT INTO users (email, hashed_password, role, created_at) "
+            "SELECT 'user' || n || '@example.com', 'x', 'viewer', now() FROM generate_series(1, 1000) n"
+        ))
+        for start in range(0, rows, SEED_BATCH):
+            # user 1 owns every other row; uploaded_at repeats, so the id breaks ties
+            await session.execute(text(
+                "INSERT INTO files (owner_id, filename, content_type, size, uploaded_at, storage_key) "
+                "SELECT CASE WHEN n % 2 = 0 THEN 1 ELSE 2 + n % 999 END, 'file-' || n || '.bin', "
+                "'application/octet-stream', n % 100000, "
+                "timestamptz '2026-01-01' + (n / 3) * interval '1 second', 'seed/' || n "
+                "FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) n"
+            ), {"start": start + 1, "stop": min(start + SEED_BATCH, rows)})
+            await session.commit()
+        await session.execute(text("ANALYZE files"))
+        await session.commit()
+
+
+async def _median_ms(session_maker, query, repeat: int = 5) -> float:
+    samples = []
+    async with session_maker() as session:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            (await session.execute(query)).scalars().all()
+            samples.append(time.perf_counter() - start)
+            session.expunge_all()
+    return statistics.median(samples) * 1000
+
+
+async def run(url: str, rows: int) -> None:
+    await reset_schema(url)
+    engine = create_async_engine(url)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    start = time.perf_counter()
+    await _seed(session_maker, rows)
+    print(f"seeded {rows:,} files in {time.perf_counter() - start:.0f}s")
+
+    listings = {
+        "/files/me": select(File).where(File.owner_id == 1, File.deleted_at.is_(None)),
+        "/files/admin/all": select(File).where(File.deleted_at.is_(None)),
+    }
+    for name, base in listings.items():
+        async with session_maker() as session:
+            total = await session.scalar(select(text("count(*)")).select_from(base.subquery()))
+        print(f"{name} ({total:,} rows, {LIMIT} per page)")
+        depth = 1
+        while depth * LIMIT < total:
+            offset = (depth - 1) * LIMIT
+            ordered = base.order_by(File.uploaded_at.desc(), File.id.desc())
+            cursor = None
+            if offset:
+                # the cursor a client holds after reading `depth - 1` pages
+                async with session_maker() as session:
+                    last = (await session.execute(
+                        ordered.with_only_columns(File.uploaded_at, File.id).offset(offset - 1).limit(1)
+                    )).one()
+                cursor = encode_cursor(last.uploaded_at, last.id)
+            keyset_ms = await _median_ms(
+                session_maker, keyset(base, ts_col=File.uploaded_at, id_col=File.id, cursor=cursor, limit=LIMIT)
+            )
+            offset_ms = await _median_ms(session_maker, ordered.offset(offset).limit(LIMIT))
+            print(f"  page {depth:>8,}  keyset {keyset_ms:7.2f}ms  offset {offset_ms:9.2f}ms")
+            depth *= 10
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    asyncio.run(run(database_url(), parser.parse_args().rows))
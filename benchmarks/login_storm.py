@@ -0,0 +1,81 @@
+"""
+/files/download-url latency during a login storm. download_url is called every
+10ms on the event loop while --logins concurrent clients keep verifying bcrypt
+passwords: inline on the loop, as before, or through verify_password_async's
+bounded pool, whose overflow is rejected (503) instead of queued. Latency is
+measured from each call's scheduled time, so loop stalls count. Needs no network.
+
+    python -m benchmarks.login_storm --seconds 5 --logins 64
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import percentiles
+
+from app.config import settings
+from app.core import security
+from app.models.file import File
+from app.routes.files import download_url
+
+INTERVAL = 0.01
+
+
+async def _downloads(stop: float) -> list[float]:
+    db_file = File(id=1, owner_id=1, storage_key="1/report.pdf")
+    samples = []
+    scheduled = time.perf_counter()
+    while scheduled < stop:
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        await download_url(db_file)
+        samples.append(time.perf_counter() - scheduled)
+        scheduled += INTERVAL
+    return samples
+
+
+async def _storm(mode: str, clients: int, stop: float, hashed: str) -> tuple[int, int]:
+    done = rejected = 0
+
+    async def client():
+        nonlocal done, rejected
+        while time.perf_counter() < stop:
+            if mode == "inline":
+                security.verify_password("hunter22", hashed)
+                # a real handler awaits its DB query around here
+                await asyncio.sleep(0)
+            else:
+                try:
+                    await security.verify_password_async("hunter22", hashed)
+                except security.HashingOverloaded:
+                    rejected += 1
+                    # the client got a 503 and backs off before retrying
+                    await asyncio.sleep(0.05)
+                    continue
+            done += 1
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return done, rejected
+
+
+async def run(seconds: float, clients: int) -> None:
+    hashed = security.hash_password("hunter22")
+    print(
+        f"{clients} login clients, PASSWORD_HASH_WORKERS={settings.PASSWORD_HASH_WORKERS}, "
+        f"PASSWORD_HASH_QUEUE={settings.PASSWORD_HASH_QUEUE}"
+    )
+    for mode in ("idle", "inline", "pool"):
+        stop = time.perf_counter() + seconds
+        storm = _storm(mode, clients if mode != "idle" else 0, stop, hashed)
+        samples, (done, rejected) = await asyncio.gather(_downloads(stop), storm)
+        print(
+            f"{mode:6} download-url {percentiles(samples)}  "
+            f"logins {done / seconds:.0f}/s, rejected {rejected / seconds:.0f}/s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--logins", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.logins))
@@ -0,0 +1,74 @@
+"""
+Presigned URLs per second: boto3's generate_presigned_url, the in-process
+SigV4Presigner, and the url_cache in front of it. Also checks the two signers
+agree byte for byte on a sample of keys. Needs no network.
+
+    python -m benchmarks.presign_urls --urls 20000
+"""
+import argparse
+import time
+
+from benchmarks.common import percentiles
+
+from app.storage.s3 import S3Storage, url_cache
+
+
+def _rate(sign, keys) -> tuple[float, list[float]]:
+    samples = []
+    start = time.perf_counter()
+    for key in keys:
+        t = time.perf_counter()
+        sign(key)
+        samples.append(time.perf_counter() - t)
+    return len(keys) / (time.perf_counter() - start), samples
+
+
+def _identical(storage: S3Storage, keys) -> bool:
+    for key in keys:
+        while True:
+            second = int(time.time())
+            ours = storage.presigned_get(key=key)
+            theirs = storage.client.generate_presigned_url(
+                "get_object", Params={"Bucket": storage.bucket, "Key": key}, ExpiresIn=3600
+            )
+            # X-Amz-Date differs when the clock ticked in between
+            if int(time.time()) == second:
+                break
+        if ours != theirs:
+            print(f"mismatch for {key!r}:\n  {ours}\n  {theirs}")
+            return False
+    return True
+
+
+def run(urls: int) -> None:
+    storage = S3Storage()
+    if storage.presigner is None:
+        raise SystemExit("the local presigner is disabled for this endpoint, see the log")
+    keys = [f"42/{n:08d}-holiday photo ü.jpg" for n in range(urls)]
+    print(f"identical to boto3 on {min(urls, 500)} keys: {_identical(storage, keys[:500])}")
+
+    def boto3(key):
+        return storage.client.generate_presigned_url(
+            "get_object", Params={"Bucket": storage.bucket, "Key": key}, ExpiresIn=3600
+        )
+
+    def local(key):
+        return storage.presigned_get(key=key)
+
+    def cached(key):
+        return storage.presigned_get(key=key, cache=True)
+
+    # warm keys that all fit, so every lookup below is a hit
+    warm = keys[:url_cache.maxsize]
+    url_cache.clear()
+    for key in warm:
+        cached(key)
+    for name, sign, sample in (("boto3", boto3, keys), ("SigV4Presigner", local, keys), ("url_cache hit", cached, warm)):
+        rate, samples = _rate(sign, sample)
+        print(f"{name:15} {rate:10,.0f} URLs/s  {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=20_000)
+    run(parser.parse_args().urls)
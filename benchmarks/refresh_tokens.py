@@ -0,0 +1,109 @@
+"""
+refresh_tokens at scale: seeds --rows tokens (by default 70% expired, 10% revoked
+past retention, 20% live), then times the /auth/refresh rotation UPDATE on live
+JTIs, the prune_refresh_tokens batches, and rotation again on the pruned table.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.refresh_tokens --rows 20000000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import database_url, percentiles, reset_schema
+
+from sqlalchemy import event, func, select, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import settings
+from app.models.refresh_token import RefreshToken
+from app.tasks import tokens
+
+SEED_BATCH = 1_000_000
+SAMPLE = 2000
+
+
+async def _seed(session_maker, rows: int) -> None:
+    async with session_maker() as session:
+        await session.execute(text(
+            "INSERT INTO users (email, hashed_password, role, created_at) "
+            "SELECT 'user' || n || '@example.com', 'x', 'viewer', now() FROM generate_series(1, 10000) n"
+        ))
+        for start in range(0, rows, SEED_BATCH):
+            # n % 10: 0-6 expired, 7 revoked past retention, 8-9 live
+            await session.execute(text(
+                "INSERT INTO refresh_tokens (jti, user_id, revoked, revoked_at, issued_at, expires_at) "
+                "SELECT md5(n::text), 1 + n % 10000, n % 10 = 7, "
+                "CASE WHEN n % 10 = 7 THEN now() - interval '3 days' END, now() - interval '8 days', "
+                "CASE WHEN n % 10 < 7 THEN now() - interval '1 day' ELSE now() + interval '6 days' END "
+                "FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) n"
+            ), {"start": start + 1, "stop": min(start + SEED_BATCH, rows)})
+            await session.commit()
+        await session.execute(text("ANALYZE refresh_tokens"))
+        await session.commit()
+
+
+async def _rotate(session_maker, jtis: list[str]) -> list[float]:
+    """The rotation statement from /auth/refresh, once per JTI, each in its own transaction."""
+    samples = []
+    for jti in jtis:
+        start = time.perf_counter()
+        async with session_maker() as session:
+            now = datetime.now(timezone.utc)
+            await session.scalar(
+                update(RefreshToken)
+                .where(RefreshToken.jti == jti, RefreshToken.revoked.is_(False), RefreshToken.expires_at > now)
+                .values(revoked=True, revoked_at=now)
+                .returning(RefreshToken.user_id)
+            )
+            # rolled back, so the same JTIs can be rotated again after the prune
+            await session.rollback()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def run(url: str, rows: int) -> None:
+    await reset_schema(url)
+    engine = create_async_engine(url)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    start = time.perf_counter()
+    await _seed(session_maker, rows)
+    print(f"seeded {rows:,} refresh tokens in {time.perf_counter() - start:.0f}s")
+
+    async with session_maker() as session:
+        # live tokens spread over the whole id range
+        jtis = (await session.execute(text(
+            "SELECT md5(n::text) FROM generate_series(CAST(9 AS bigint), :rows, :step) n"
+        ), {"rows": rows, "step": max(10, rows // SAMPLE // 10 * 10)})).scalars().all()
+    print(f"rotate before prune  {percentiles(await _rotate(session_maker, jtis))}")
+
+    batches = []
+    event.listen(
+        engine.sync_engine, "before_cursor_execute",
+        lambda conn, cursor, statement, *args: conn.info.__setitem__("started", time.perf_counter()),
+    )
+    event.listen(
+        engine.sync_engine, "after_cursor_execute",
+        lambda conn, cursor, statement, *args: statement.startswith("DELETE")
+        and batches.append(time.perf_counter() - conn.info["started"]),
+    )
+    tokens.worker_session_maker = session_maker
+    start = time.perf_counter()
+    pruned = await tokens._prune(datetime.now(timezone.utc))
+    elapsed = time.perf_counter() - start
+    print(
+        f"pruned {pruned:,} rows in {elapsed:.1f}s ({pruned / elapsed:,.0f} rows/s), "
+        f"{len(batches)} batches of {settings.REFRESH_TOKEN_PRUNE_BATCH}: {percentiles(batches)}"
+    )
+
+    async with session_maker() as session:
+        left = await session.scalar(select(func.count()).select_from(RefreshToken))
+    print(f"{left:,} rows left")
+    print(f"rotate after prune   {percentiles(await _rotate(session_maker, jtis))}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    asyncio.run(run(database_url(), parser.parse_args().rows))
@@ -0,0 +1,109 @@
+"""
+A local S3 stand-in for benchmarks: just enough of the REST API for HEAD, GET,
+PUT (including server-side copy) and DeleteObjects, with a fixed latency added
+to every response. Every key exists and holds `size` bytes of filler (or
+`body`, when given), so nothing has to be uploaded first; its ETag is derived
+from the key.
+
+Point boto3 at it with AWS_ENDPOINT_URL_S3, before anything from `app` is imported:
+
+    with s3_standin(size=1024, latency=0.02) as endpoint:
+        os.environ["AWS_ENDPOINT_URL_S3"] = endpoint
+"""
+import hashlib
+import multiprocessing
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = bytes(range(256)) * 4096  # 1 MiB
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; with Nagle on, each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    size = 0
+    body = None
+    content_type = None
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status: int, length: int, extra: dict | None = None) -> None:
+        time.sleep(self.latency)
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Last-Modified", formatdate(usegmt=True))
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _object_headers(self) -> dict:
+        etag = hashlib.md5(self.path.split("?")[0].encode()).hexdigest()
+        content_type = self.content_type or ("application/octet-stream" if self.body else "text/plain")
+        return {"ETag": f'"{etag}"', "Content-Type": content_type}
+
+    def _xml(self, body: str) -> None:
+        data = f'<?xml version="1.0" encoding="UTF-8"?>{body}'.encode()
+        self._headers(200, len(data), {"Content-Type": "application/xml"})
+        self.wfile.write(data)
+
+    def _drain(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        while length > 0:
+            length -= len(self.rfile.read(min(length, len(FILLER))))
+
+    def do_HEAD(self):
+        self._headers(200, self.size, self._object_headers())
+
+    def do_GET(self):
+        self._headers(200, self.size, self._object_headers())
+        if self.body:
+            self.wfile.write(self.body)
+            return
+        left = self.size
+        while left > 0:
+            chunk = FILLER[:left]
+            self.wfile.write(chunk)
+            left -= len(chunk)
+
+    def do_PUT(self):
+        self._drain()
+        if self.headers.get("x-amz-copy-source"):
+            etag = self._object_headers()["ETag"].replace('"', "&quot;")
+            self._xml(f"<CopyObjectResult><ETag>{etag}</ETag></CopyObjectResult>")
+        else:
+            self._headers(200, 0, self._object_headers())
+
+    def do_POST(self):
+        # DeleteObjects: report every key as deleted by leaving the result empty
+        self._drain()
+        self._xml('<DeleteResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"></DeleteResult>')
+
+
+def _serve(port, size: int, body: bytes | None, content_type: str | None, latency: float) -> None:
+    handler = type("Handler", (_Handler,), {
+        "size": len(body) if body else size, "body": body, "content_type": content_type, "latency": latency,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    port.value = server.server_address[1]
+    server.serve_forever()
+
+
+@contextmanager
+def s3_standin(*, size: int = 0, body: bytes | None = None, content_type: str | None = None, latency: float = 0.0):
+    """Run the stand-in in a child process, so it doesn't share the benchmark's GIL or RSS."""
+    port = multiprocessing.Value("i", 0)
+    process = multiprocessing.Process(target=_serve, args=(port, size, body, content_type, latency), daemon=True)
+    process.start()
+    try:
+        while not port.value:
+            time.sleep(0.01)
+        yield f"http://127.0.0.1:{port.value}"
+    finally:
+        process.terminate()
+        process.join()
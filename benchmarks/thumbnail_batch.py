@@ -0,0 +1,131 @@
+"""
+Thumbnail throughput for a burst of single /files/finalize calls of small images
+(avatars, screenshots). Each finalize queues its job in the files row. The jobs then
+run either as one resize_image message per upload, as they were published before,
+or the way dispatch_thumbnails sends them: claimed together and published
+THUMB_BATCH_SIZE per resize_image_batch message. Originals come from the local S3
+stand-in and statuses are written to PostgreSQL, as in the worker.
+
+Tasks run with apply() in this process, so broker round trips, which batching
+also saves, are not included.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.thumbnail_batch \\
+        --uploads 256 --megapixels 0.3 --s3-latency-ms 20
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+
+from benchmarks.common import database_url, reset_schema
+from benchmarks.s3_standin import s3_standin
+
+from PIL import Image
+
+
+def _original(megapixels: float) -> bytes:
+    side = int((megapixels * 1_000_000) ** 0.5)
+    img = Image.merge("RGB", [Image.effect_noise((side, side), 40 + 10 * n) for n in range(3)])
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+async def _finalize_uploads(url: str, uploads: int):
+    from fastapi import Response
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.models.user import User
+    from app.routes import files as files_route
+    from app.schemas.file import FinalizeRequest
+    from app.tasks import thumbnails
+
+    await reset_schema(url)
+    # the tasks write through this too, one asyncio.run per task as in the worker
+    engine = create_async_engine(url, poolclass=NullPool)
+    thumbnails.worker_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with thumbnails.worker_session_maker() as session:
+        owner = User(email="bench@example.com", hashed_password="x")
+        session.add(owner)
+        await session.commit()
+
+    start = time.perf_counter()
+    for n in range(uploads):
+        async with thumbnails.worker_session_maker() as session:
+            await files_route.finalize_upload(
+                FinalizeRequest(key=f"{owner.id}/avatar-{n}.jpg", filename="avatar.jpg"), Response(), session, owner
+            )
+    return time.perf_counter() - start
+
+
+async def _requeue() -> None:
+    from sqlalchemy import update
+
+    from app.models.file import File
+    from app.tasks import thumbnails
+
+    async with thumbnails.worker_session_maker() as session:
+        await session.execute(update(File).values(thumbnail_status="queued", renditions=None))
+        await session.commit()
+
+
+async def _claim_one_by_one() -> list[dict]:
+    """The queued rows' jobs, as each finalize built them before: one per message."""
+    from sqlalchemy import select
+
+    from app.models.file import File
+    from app.storage.s3 import S3Storage
+    from app.tasks import thumbnails
+
+    async with thumbnails.worker_session_maker() as session:
+        rows = (await session.execute(select(File).where(File.thumbnail_status == "queued"))).scalars().all()
+        jobs = [thumbnails.thumbnail_job(S3Storage(), f) for f in rows]
+        await session.commit()
+    return jobs
+
+
+def run(url: str, uploads: int) -> None:
+    from app.config import settings
+    from app.tasks import thumbnails
+
+    published = []
+    thumbnails.publish_jobs = published.append
+
+    finalize = asyncio.run(_finalize_uploads(url, uploads))
+    print(f"{uploads} single finalizes in {finalize:.1f}s, thumbnails queued")
+
+    start = time.perf_counter()
+    for job in asyncio.run(_claim_one_by_one()):
+        assert thumbnails.resize_image.apply(kwargs=job).get()["ok"]
+    per_upload = time.perf_counter() - start
+
+    asyncio.run(_requeue())
+    start = time.perf_counter()
+    assert thumbnails.dispatch_thumbnails()["dispatched"] == uploads
+    # what publish_jobs would have sent
+    size = settings.THUMB_BATCH_SIZE
+    messages = [jobs[i:i + size] for jobs in published for i in range(0, len(jobs), size)]
+    for chunk in messages:
+        assert thumbnails.resize_image_batch.apply((chunk,)).get()["failed"] == 0
+    dispatched = time.perf_counter() - start
+
+    print(f"message per upload    {uploads / per_upload:6.1f} images/s  ({uploads} resize_image messages)")
+    print(
+        f"dispatch_thumbnails   {uploads / dispatched:6.1f} images/s  ({len(messages)} resize_image_batch messages, "
+        f"{settings.THUMB_BATCH_WORKERS} threads each)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=256)
+    parser.add_argument("--megapixels", type=float, default=0.3)
+    parser.add_argument("--s3-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+    url = database_url()
+    body = _original(args.megapixels)
+    with s3_standin(body=body, content_type="image/jpeg", latency=args.s3_latency_ms / 1000) as endpoint:
+        os.environ["AWS_ENDPOINT_URL_S3"] = endpoint
+        run(url, args.uploads)
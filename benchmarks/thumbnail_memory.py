@@ -0,0 +1,97 @@
+"""
+Peak memory and wall time per megapixel of the thumbnail pipeline (_process:
+streamed download into a spool, one draft()/decode pass, downscale cascade)
+against the old one (whole body in memory, verify() and a second open, full-size
+decode), for JPEG and PNG originals served by the local S3 stand-in. Each run is
+a fresh process, so peaks don't carry over.
+
+    python -m benchmarks.thumbnail_memory --megapixels 1 6 24 48
+"""
+import argparse
+import io
+import multiprocessing
+import time
+
+import benchmarks.common  # settings defaults, in the spawned children too
+from benchmarks.s3_standin import s3_standin
+
+from PIL import Image
+
+
+def _original(megapixels: float, fmt: str) -> bytes:
+    side = int((megapixels * 1_000_000) ** 0.5)
+    # noise, so the encoded size is that of a photo rather than a flat colour
+    channels = [Image.effect_noise((side, side), 40 + 10 * n).resize((side, side)) for n in range(3)]
+    img = Image.merge("RGB", channels)
+    output = io.BytesIO()
+    img.save(output, format=fmt, **({"quality": 90} if fmt == "JPEG" else {"compress_level": 1}))
+    return output.getvalue()
+
+
+def _hwm_mb() -> float:
+    # not ru_maxrss: Linux keeps that across the spawn's fork and exec, so it starts
+    # at the parent's peak, which generating the originals pushes well up
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+
+
+def _legacy(get_url: str, targets: list[dict]) -> None:
+    import requests
+
+    from app.tasks.thumbnails import RENDITION_FORMATS
+
+    data = requests.get(get_url, timeout=60).content
+    Image.open(io.BytesIO(data)).verify()
+    img = Image.open(io.BytesIO(data)).convert("RGB")
+    for t in targets:
+        copy = img.copy()
+        copy.thumbnail((t["size"], t["size"]))
+        pil_format, content_type, _, options = RENDITION_FORMATS[t["format"]]
+        output = io.BytesIO()
+        copy.save(output, format=pil_format, **options)
+        requests.put(t["put_url"], data=output.getvalue(), headers={"Content-Type": content_type}, timeout=60)
+
+
+def _measure(pipeline: str, endpoint: str, results) -> None:
+    # imported here, in the fresh process, so the baseline includes them
+    from app.tasks import thumbnails
+    Image.init()
+
+    targets = [
+        {"size": size, "format": fmt, "key": f"1/img@{size}.{fmt}", "put_url": f"{endpoint}/bucket/1/img@{size}.{fmt}"}
+        for size, fmt in thumbnails.rendition_specs()
+    ]
+    get_url = f"{endpoint}/bucket/1/img"
+    baseline = _hwm_mb()
+    start = time.perf_counter()
+    if pipeline == "streaming":
+        assert thumbnails._process(1, get_url, targets)["ok"]
+    else:
+        _legacy(get_url, targets)
+    seconds = time.perf_counter() - start
+    results.put((seconds, _hwm_mb() - baseline))
+
+
+def run(megapixels: list[float]) -> None:
+    spawn = multiprocessing.get_context("spawn")
+    print(f"{'MP':>4} {'format':6} {'input':>8}  {'pipeline':9} {'wall':>9} {'per MP':>9} {'peak RSS':>10}")
+    for mp in megapixels:
+        for fmt in ("JPEG", "PNG"):
+            body = _original(mp, fmt)
+            with s3_standin(body=body) as endpoint:
+                for pipeline in ("legacy", "streaming"):
+                    results = spawn.Queue()
+                    child = spawn.Process(target=_measure, args=(pipeline, endpoint, results))
+                    child.start()
+                    seconds, peak_mb = results.get()
+                    child.join()
+                    print(
+                        f"{mp:4g} {fmt:6} {len(body) / 2 ** 20:6.1f}MB  {pipeline:9} "
+                        f"{seconds * 1000:7.0f}ms {seconds * 1000 / mp:7.0f}ms {peak_mb:+8.0f}MB"
+                    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 6, 24, 48])
+    run(parser.parse_args().megapixels)
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+
+# Settings are read at import time; nothing here talks to S3 or the broker
+for name, value in {
+    "DB_HOST": "localhost", "DB_PORT": "5432", "DB_USER": "postgres", "DB_PASS": "postgres", "DB_NAME": "file_api",
+    "SECRET_KEY": "test-secret", "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "15", "REFRESH_TOKEN_EXPIRE_DAYS": "7",
+    "S3_BUCKET": "test-bucket", "S3_REGION": "eu-central-1",
+    "S3_ACCESS_KEY_ID": "AKIAEXAMPLE", "S3_SECRET_ACCESS_KEY": "secret",
+    "CELERY_BROKER_URL": "memory://",
+}.items():
+    os.environ.setdefault(name, value)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.database import Base
+from app.models.user import User
+from app.models.refresh_token import RefreshToken
+from app.models.file import File
+from app.models.blob import Blob
+from app.models.multipart_upload import MultipartUpload
+from app.models.user_usage import UserUsage
+
+
+async def _reset_schema(url: str) -> None:
+    engine = create_async_engine(url, poolclass=NullPool)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+@pytest.fixture
+def database_url():
+    """
+    A freshly created schema in the PostgreSQL database at TEST_DATABASE_URL
+    (postgresql+asyncpg://...). Its tables are dropped, so never point it at real data.
+    """
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    asyncio.run(_reset_schema(url))
+    return url
@@ -0,0 +1,160 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+from fastapi import Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import settings
+from app.models.blob import Blob
+from app.models.file import File
+from app.models.user import User
+from app.models.user_usage import UserUsage
+from app.routes import files as files_route
+from app.schemas.file import FinalizeRequest
+
+CONCURRENCY = 50
+SIZE = 1234
+ETAG = "9b2cf535f27731c974343645a3985328"
+
+
+class FakeS3:
+    """The AsyncS3Storage calls finalize makes: every key holds the same object until it's deleted."""
+
+    def __init__(self):
+        self.deleted = []
+
+    async def head(self, key):
+        # yield, so the finalizes interleave before reaching the database
+        await asyncio.sleep(0)
+        if key in self.deleted:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": SIZE, "ETag": f'"{ETAG}"', "ContentType": "text/plain"}
+
+    async def delete_many(self, keys):
+        self.deleted += keys
+        return []
+
+    def presigned_get(self, key, expires_in=3600, cache=False):
+        return f"https://s3.test/{key}"
+
+
+async def _finalize_all(url: str, keys: list[str], shared_since: timedelta | None = None, retry: bool = False):
+    """
+    Finalize `keys` concurrently, and with `retry` each key once more afterwards, the
+    way a client does that missed the response. With `shared_since`, the content is
+    already a blob that old.
+    """
+    engine = create_async_engine(url, pool_size=CONCURRENCY, max_overflow=0)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        user = User(email="owner@example.com", hashed_password="x")
+        session.add(user)
+        await session.flush()
+        if shared_since is not None:
+            blob = Blob(
+                storage_key=f"{user.id}/original", size=SIZE, etag=ETAG,
+                created_at=datetime.now(timezone.utc) - shared_since,
+            )
+            session.add(blob)
+            await session.flush()
+            session.add(File(
+                owner_id=user.id, storage_key=blob.storage_key, filename="original.txt", content_type="text/plain",
+                size=SIZE, etag=ETAG, blob_id=blob.id,
+            ))
+        await session.commit()
+    principal = SimpleNamespace(id=user.id, email=user.email, role="viewer")
+
+    async def finalize(key):
+        # FastAPI falls back to the route's status_code, 201, unless the handler changes it
+        response = Response(status_code=status.HTTP_201_CREATED)
+        async with session_maker() as session:
+            await files_route.finalize_upload(
+                FinalizeRequest(key=f"{principal.id}/{key}", filename="report.txt"), response, session, principal
+            )
+        return response.status_code
+
+    try:
+        statuses = await asyncio.gather(*(finalize(key) for key in keys))
+        if retry:
+            statuses += [await finalize(key) for key in dict.fromkeys(keys)]
+        async with session_maker() as session:
+            files = (await session.execute(select(File).where(File.storage_key.in_(
+                [f"{principal.id}/{key}" for key in keys]
+            )))).scalars().all()
+            blobs = (await session.execute(select(Blob))).scalars().all()
+            usage = await session.get(UserUsage, principal.id)
+            return statuses, files, blobs, usage
+    finally:
+        await engine.dispose()
+
+
+def test_concurrent_finalizes_of_one_key_insert_one_row(database_url, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(files_route, "s3", s3)
+
+    statuses, files, blobs, usage = asyncio.run(_finalize_all(database_url, ["upload"] * CONCURRENCY))
+
+    # no unique violations: exactly one finalize created the row, the rest refreshed it
+    assert sorted(statuses) == [status.HTTP_200_OK] * (CONCURRENCY - 1) + [status.HTTP_201_CREATED]
+    assert len(files) == 1
+    # the upload is the blob, in place
+    assert files[0].object_key is None
+    assert [(b.id, b.storage_key, b.refcount) for b in blobs] == [(files[0].blob_id, files[0].storage_key, 1)]
+    assert s3.deleted == []
+    assert (usage.bytes, usage.files) == (SIZE, 1)
+
+
+def test_new_content_is_not_shared_while_its_upload_urls_are_valid(database_url, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(files_route, "s3", s3)
+
+    keys = [f"upload-{n}" for n in range(CONCURRENCY)]
+    statuses, files, blobs, usage = asyncio.run(_finalize_all(database_url, keys))
+
+    assert statuses == [status.HTTP_201_CREATED] * CONCURRENCY
+    # one finalize created the blob; the others found it too young and kept their objects
+    owners = [f for f in files if f.blob_id is not None]
+    assert [(b.storage_key, b.refcount) for b in blobs] == [(owners[0].storage_key, 1)]
+    assert len(owners) == 1
+    assert {f.object_key for f in files} == {None}
+    assert s3.deleted == []
+    assert (usage.bytes, usage.files) == (SIZE * CONCURRENCY, CONCURRENCY)
+
+
+def test_concurrent_finalizes_of_known_content_share_its_blob(database_url, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(files_route, "s3", s3)
+
+    keys = [f"upload-{n}" for n in range(CONCURRENCY)]
+    shared_since = timedelta(seconds=settings.UPLOAD_URL_EXPIRES_SECONDS + 60)
+    statuses, files, blobs, usage = asyncio.run(_finalize_all(database_url, keys, shared_since))
+
+    assert statuses == [status.HTTP_201_CREATED] * CONCURRENCY
+    [blob] = blobs
+    assert {f.object_key for f in files} == {blob.storage_key}
+    # the finalizes wait on the blob row in turn, none loses its increment
+    assert blob.refcount == CONCURRENCY + 1
+    assert sorted(s3.deleted) == sorted(f.storage_key for f in files)
+    assert (usage.bytes, usage.files) == (SIZE * CONCURRENCY, CONCURRENCY)
+
+
+def test_finalize_retried_after_its_upload_was_shared_returns_the_file(database_url, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(files_route, "s3", s3)
+
+    shared_since = timedelta(seconds=settings.UPLOAD_URL_EXPIRES_SECONDS + 60)
+    statuses, files, blobs, usage = asyncio.run(
+        _finalize_all(database_url, ["upload"] * CONCURRENCY, shared_since, retry=True)
+    )
+
+    # the upload is deleted once it shares the blob; the retry's HEAD finds nothing but gets the row
+    assert s3.deleted == [files[0].storage_key]
+    assert sorted(statuses) == [status.HTTP_200_OK] * CONCURRENCY + [status.HTTP_201_CREATED]
+    [db_file] = files
+    [blob] = blobs
+    assert db_file.object_key == blob.storage_key
+    assert blob.refcount == 2
+    assert (usage.bytes, usage.files) == (SIZE, 1)
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.models.file import File
+from app.models.user import User
+from app.routes import files as files_route
+from app.schemas.file import FinalizeBatchRequest, FinalizeRequest
+from app.tasks import thumbnails
+
+UPLOADS = settings.THUMB_BATCH_SIZE + 8
+
+
+class FakeS3:
+    """Every key holds a different small PNG."""
+
+    async def head(self, key):
+        await asyncio.sleep(0)
+        return {"ContentLength": 2048, "ETag": f'"{key.replace("/", "-")}"', "ContentType": "image/png"}
+
+    async def delete_many(self, keys):
+        return []
+
+    def presigned_get(self, key, expires_in=3600, cache=False):
+        return f"https://s3.test/{key}"
+
+    def presigned_put(self, key, content_type=None, expires_in=3600, content_length=None, cache=False):
+        return f"https://s3.test/{key}?put"
+
+
+def _setup(database_url, monkeypatch):
+    """Route the API and the dispatch task to fakes; returns the direct and dispatched publishes."""
+    direct, dispatched = [], []
+
+    async def submit(jobs):
+        direct.append(jobs)
+
+    monkeypatch.setattr(files_route, "s3", FakeS3())
+    monkeypatch.setattr(files_route, "submit_thumbnail_jobs", submit)
+    monkeypatch.setattr(thumbnails, "S3Storage", FakeS3)
+    monkeypatch.setattr(thumbnails, "publish_jobs", dispatched.append)
+    # the task runs its own event loops, so no connection may outlive one
+    engine = create_async_engine(database_url, poolclass=NullPool)
+    monkeypatch.setattr(thumbnails, "worker_session_maker", async_sessionmaker(engine, expire_on_commit=False))
+    return direct, dispatched
+
+
+async def _user(session_maker):
+    async with session_maker() as session:
+        user = User(email="owner@example.com", hashed_password="x")
+        session.add(user)
+        await session.commit()
+    return SimpleNamespace(id=user.id, email=user.email, role="viewer")
+
+
+async def _statuses(session_maker) -> dict[str, int]:
+    async with session_maker() as session:
+        rows = (await session.execute(select(File.thumbnail_status))).scalars().all()
+    return {status: rows.count(status) for status in set(rows)}
+
+
+def test_single_uploads_are_published_together_by_the_dispatcher(database_url, monkeypatch):
+    direct, dispatched = _setup(database_url, monkeypatch)
+    session_maker = thumbnails.worker_session_maker
+
+    async def finalize_all():
+        user = await _user(session_maker)
+
+        async def finalize(n):
+            async with session_maker() as session:
+                await files_route.finalize_upload(
+                    FinalizeRequest(key=f"{user.id}/avatar-{n}.png", filename="avatar.png"), Response(), session, user
+                )
+
+        await asyncio.gather(*(finalize(n) for n in range(UPLOADS)))
+        return await _statuses(session_maker)
+
+    assert asyncio.run(finalize_all()) == {"queued": UPLOADS}
+    assert direct == []
+
+    assert thumbnails.dispatch_thumbnails() == {"dispatched": UPLOADS}
+    [jobs] = dispatched
+    assert len({job["file_id"] for job in jobs}) == UPLOADS
+    assert asyncio.run(_statuses(session_maker)) == {"pending": UPLOADS}
+
+    # nothing left for the next run
+    assert thumbnails.dispatch_thumbnails() == {"dispatched": 0}
+    assert len(dispatched) == 1
+
+
+def test_a_batch_publishes_full_messages_and_queues_the_rest(database_url, monkeypatch):
+    direct, dispatched = _setup(database_url, monkeypatch)
+    session_maker = thumbnails.worker_session_maker
+
+    async def finalize_batch():
+        user = await _user(session_maker)
+        payload = FinalizeBatchRequest(
+            files=[{"key": f"{user.id}/photo-{n}.png", "filename": "photo.png"} for n in range(UPLOADS)]
+        )
+        async with session_maker() as session:
+            await files_route.finalize_batch(payload, session, user)
+        return await _statuses(session_maker)
+
+    leftover = UPLOADS % settings.THUMB_BATCH_SIZE
+    assert asyncio.run(finalize_batch()) == {"pending": settings.THUMB_BATCH_SIZE, "queued": leftover}
+    assert [len(jobs) for jobs in direct] == [settings.THUMB_BATCH_SIZE]
+
+    thumbnails.dispatch_thumbnails()
+    assert [len(jobs) for jobs in dispatched] == [leftover]